@@ -2,11 +2,17 @@ import os
 import json
 import logging
 import re
+import atexit
+import threading
+import time
+from contextlib import contextmanager
+from functools import lru_cache
 import psycopg2
-from psycopg2 import pool
-from datetime import datetime
-from collections import Counter
-import hashlib
+import psycopg2.extensions
+from psycopg2.pool import PoolError, ThreadedConnectionPool
+from psycopg2.extras import execute_values
+from collections import Counter, OrderedDict, defaultdict, deque
+import xxhash
 
 # Configure logging
 logging.basicConfig(level=logging.DEBUG)
@@ -17,6 +23,106 @@ DATABASE_URL = os.environ.get("DATABASE_URL", "")
 
 # Create a connection pool
 connection_pool = None
+DB_POOL_MIN = 2
+DB_POOL_MAX = 20
+# ThreadedConnectionPool raises PoolError when every connection is checked out, so callers
+# first take one of these slots and wait (up to DB_CONNECTION_TIMEOUT seconds) for a free one
+DB_CONNECTION_TIMEOUT = 30
+_pool_slots = threading.BoundedSemaphore(DB_POOL_MAX)
+
+# Hot lookups, prepared once per physical connection by _ensure_prepared
+PREPARED_STATEMENTS = {
+    'qa_by_hash': '''
+        PREPARE qa_by_hash (varchar) AS
+        SELECT id, use_count, response
+        FROM qa_pairs
+        WHERE query_hash = $1
+        ORDER BY use_count DESC
+        LIMIT 1
+    ''',
+    'qa_best_match': '''
+        PREPARE qa_best_match (text[], text, integer) AS
+        SELECT id, response, score
+        FROM (
+            SELECT id, response, use_count, updated_at,
+                (
+                    0.5 * kw.shared::float / (kw.total + cardinality($1) - kw.shared)
+                    + 0.5 * similarity(clean_query, $2)
+                )
+                * LEAST(length(clean_query), $3)
+                / GREATEST(length(clean_query), $3, 1)::float AS score
+            FROM qa_pairs,
+                LATERAL (
+                    SELECT count(DISTINCT k) FILTER (WHERE k = ANY($1)) AS shared,
+                           count(DISTINCT k) AS total
+                    FROM unnest(query_keywords) AS k
+                ) AS kw
+            WHERE query_keywords && $1
+              AND cardinality(query_keywords) BETWEEN cardinality($1) / 2.0 AND cardinality($1) * 2
+        ) AS candidates
+        ORDER BY score DESC NULLS LAST, use_count DESC, updated_at DESC
+        LIMIT 1
+    ''',
+}
+
+# New Q&A pairs and use_count increments are queued here and written in
+# batches by a background thread
+_pending = deque()
+_use_count_deltas = defaultdict(int)
+_lock = threading.Lock()
+_flush_requested = threading.Event()
+_flush_thread = None
+FLUSH_INTERVAL = 1.0
+FLUSH_BATCH_SIZE = 500
+# Rows kept queued while the database is unreachable; beyond this the oldest are dropped
+MAX_PENDING_INSERTS = 10_000
+USE_COUNT_FLUSH_INTERVAL = 2.0
+
+# Recent find_best_match results keyed by query hash: {hash: (expires_at, result)}.
+# Any write that changes stored answers bumps the generation and clears the cache.
+_result_cache = OrderedDict()
+_result_cache_lock = threading.RLock()
+_result_cache_generation = 0
+RESULT_CACHE_SIZE = 10000
+RESULT_CACHE_TTL = 300
+
+# Bloom filter of every stored query_hash, so queries that were never stored
+# skip the exact-hash SELECT. It is rebuilt from the table at startup; until
+# then every hash is treated as possibly stored.
+BLOOM_BITS = 1 << 24  # 2 MiB, ~0.1% false positives at 1M stored queries
+BLOOM_HASHES = 10
+_hash_bloom = bytearray(BLOOM_BITS // 8)
+_hash_bloom_lock = threading.Lock()
+_hash_bloom_ready = False
+
+# Text normalization patterns and stop words, built once at import time
+_NONWORD_RE = re.compile(r'[^\w\s]+')
+_WORD_RE = re.compile(r'\w+')
+_HTML_RE = re.compile(r'<[^>]+>')
+
+_STOP_WORDS = frozenset({
+    'the', 'a', 'an', 'and', 'or', 'but', 'is', 'are', 'was', 'were',
+    'in', 'on', 'at', 'to', 'for', 'with', 'by', 'about', 'like',
+    'from', 'of', 'as', 'what', 'when', 'where', 'who', 'why', 'how',
+    'can', 'could', 'would', 'should', 'may', 'might', 'must', 'need',
+    'have', 'has', 'had', 'do', 'does', 'did', 'will', 'shall',
+    'this', 'that', 'these', 'those', 'them', 'they', 'their', 'we', 'us',
+    'our', 'ours', 'you', 'your', 'yours', 'he', 'him', 'his', 'she',
+    'her', 'hers', 'it', 'its', 'be', 'been', 'being', 'am'
+})
+
+_STOP_WORDS_SMALL = frozenset({
+    'the', 'a', 'an', 'and', 'or', 'but', 'is', 'are', 'was', 'were',
+    'in', 'on', 'at', 'to', 'for', 'with', 'by', 'about', 'like',
+    'from', 'of', 'as', 'what', 'when', 'where', 'who', 'why', 'how'
+})
+
+# Quality-check indicators as single compiled alternations (substring semantics)
+_QUESTION_RE = re.compile(r'what|who|where|when|why|how|which|can|is|are|will|should|did|does|do')
+_COMMAND_RE = re.compile(r'tell|explain|describe|show|list|find|search|get|give')
+_ERROR_RE = re.compile(
+    r"error|sorry|couldn't find|no information|no results|unable to|failed to|cannot|not available"
+)
 
 
 def init_db():
@@ -26,49 +132,65 @@ def init_db():
     try:
         # Setup connection pool
         if not connection_pool and DATABASE_URL:
-            connection_pool = pool.SimpleConnectionPool(1, 10, DATABASE_URL)
+            connection_pool = ThreadedConnectionPool(DB_POOL_MIN, DB_POOL_MAX, DATABASE_URL,
+                                                     connection_factory=PreparingConnection)
             logger.info("Database connection pool created successfully")
 
-        # Get a connection from the pool
-        conn = get_connection()
-        cursor = conn.cursor()
+        with db_cursor() as cursor:
+            # First, check if we need to migrate the old schema
+            try:
+                cursor.execute(
+                    "SELECT column_name FROM information_schema.columns WHERE table_name='qa_pairs' AND column_name='query_hash'")
+                exists = cursor.fetchone()
+
+                if not exists:
+                    logger.info("Old schema detected. Dropping table to recreate with new schema.")
+                    cursor.execute("DROP TABLE IF EXISTS qa_pairs")
+                    cursor.connection.commit()
+            except Exception as e:
+                logger.warning(f"Error checking schema: {str(e)}")
+                # Continue with table creation
+
+            # Create improved table for storing Q&A pairs with more metadata
+            cursor.execute('''
+            CREATE TABLE IF NOT EXISTS qa_pairs (
+                id SERIAL PRIMARY KEY,
+                query TEXT NOT NULL,
+                query_hash VARCHAR(64) NOT NULL,
+                query_keywords TEXT[] NOT NULL,
+                clean_query TEXT,
+                response TEXT NOT NULL,
+                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                use_count INTEGER DEFAULT 1,
+                query_type VARCHAR(30) DEFAULT 'informational'
+            )
+            ''')
 
-        # First, check if we need to migrate the old schema
-        try:
-            cursor.execute(
-                "SELECT column_name FROM information_schema.columns WHERE table_name='qa_pairs' AND column_name='query_hash'")
-            exists = cursor.fetchone()
-
-            if not exists:
-                logger.info("Old schema detected. Dropping table to recreate with new schema.")
-                cursor.execute("DROP TABLE IF EXISTS qa_pairs")
-                conn.commit()
-        except Exception as e:
-            logger.warning(f"Error checking schema: {str(e)}")
-            # Continue with table creation
-
-        # Create improved table for storing Q&A pairs with more metadata
-        cursor.execute('''
-        CREATE TABLE IF NOT EXISTS qa_pairs (
-            id SERIAL PRIMARY KEY,
-            query TEXT NOT NULL,
-            query_hash VARCHAR(64) NOT NULL,
-            query_keywords TEXT[] NOT NULL,
-            response TEXT NOT NULL,
-            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-            updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-            use_count INTEGER DEFAULT 1,
-            query_type VARCHAR(30) DEFAULT 'informational'
-        )
-        ''')
+            # Add the precomputed cleaned query to tables created before it existed
+            cursor.execute('ALTER TABLE qa_pairs ADD COLUMN IF NOT EXISTS clean_query TEXT')
 
-        # Create indexes for faster lookups
-        cursor.execute('CREATE INDEX IF NOT EXISTS idx_query_hash ON qa_pairs(query_hash)')
-        cursor.execute('CREATE INDEX IF NOT EXISTS idx_keywords ON qa_pairs USING GIN(query_keywords)')
-        cursor.execute('CREATE INDEX IF NOT EXISTS idx_query_type ON qa_pairs(query_type)')
+            # Precomputed n-gram columns are no longer used; pg_trgm scores similarity instead
+            cursor.execute('ALTER TABLE qa_pairs DROP COLUMN IF EXISTS bigrams')
+            cursor.execute('ALTER TABLE qa_pairs DROP COLUMN IF EXISTS trigrams')
 
-        conn.commit()
-        release_connection(conn)
+            # Create indexes for faster lookups
+            cursor.execute('CREATE INDEX IF NOT EXISTS idx_query_hash ON qa_pairs(query_hash)')
+            cursor.execute('CREATE INDEX IF NOT EXISTS idx_keywords ON qa_pairs USING GIN(query_keywords)')
+            cursor.execute('CREATE INDEX IF NOT EXISTS idx_query_type ON qa_pairs(query_type)')
+            cursor.execute('CREATE INDEX IF NOT EXISTS idx_keyword_count ON qa_pairs(cardinality(query_keywords))')
+
+            # Trigram similarity is scored server-side in find_best_match
+            cursor.execute('CREATE EXTENSION IF NOT EXISTS pg_trgm')
+            cursor.execute('CREATE INDEX IF NOT EXISTS idx_query_trgm ON qa_pairs USING GIN(clean_query gin_trgm_ops)')
+
+            # Re-key rows that were stored with the old SHA-256 fingerprints
+            migrate_query_hashes(cursor)
+            backfill_query_features(cursor)
+            load_hash_bloom(cursor)
+
+        # Start writing queued Q&A pairs in the background
+        start_flush_thread()
 
         logger.info("Database initialized successfully")
 
@@ -77,26 +199,312 @@ def init_db():
         raise
 
 
+class PreparingConnection(psycopg2.extensions.connection):
+    """Connection that remembers whether the hot statements were prepared on it."""
+    prepared = False
+
+
 def get_connection():
-    """Get a database connection from the pool."""
+    """Get a database connection from the pool, waiting for one if all are in use."""
     global connection_pool
     if connection_pool:
-        return connection_pool.getconn()
+        if not _pool_slots.acquire(timeout=DB_CONNECTION_TIMEOUT):
+            raise PoolError(f"No database connection free within {DB_CONNECTION_TIMEOUT}s")
+        try:
+            return connection_pool.getconn()
+        except Exception:
+            _pool_slots.release()
+            raise
     else:
         # Fallback to direct connection if pool not available
-        return psycopg2.connect(DATABASE_URL)
+        return psycopg2.connect(DATABASE_URL, connection_factory=PreparingConnection)
+
+
+def _ensure_prepared(cursor):
+    """
+    PREPARE the hot lookups on the cursor's connection the first time it is used,
+    so later calls only pay for EXECUTE instead of parsing and planning each time.
+    Must be called before any other statement in the cursor's transaction.
+    """
+    conn = cursor.connection
+    if conn.prepared:
+        return
+
+    for statement in PREPARED_STATEMENTS.values():
+        cursor.execute(statement)
+    conn.commit()
+    conn.prepared = True
 
 
 def release_connection(conn):
     """Release a connection back to the pool."""
     global connection_pool
     if connection_pool:
-        connection_pool.putconn(conn)
+        try:
+            connection_pool.putconn(conn)
+        finally:
+            _pool_slots.release()
     else:
         conn.close()
 
 
-def store_qa_pair(query, response, query_type='informational'):
+@contextmanager
+def db_conn():
+    """Borrow a connection and always hand it back, even if the caller raises."""
+    conn = get_connection()
+    try:
+        yield conn
+    finally:
+        release_connection(conn)
+
+
+@contextmanager
+def db_cursor():
+    """Yield a cursor whose transaction commits on success and rolls back on error."""
+    with db_conn() as conn:
+        cursor = conn.cursor()
+        try:
+            yield cursor
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+        finally:
+            cursor.close()
+
+
+def start_flush_thread():
+    """Start the background thread that writes queued Q&A pairs (once per process)."""
+    global _flush_thread
+    if _flush_thread and _flush_thread.is_alive():
+        return
+
+    _flush_thread = threading.Thread(target=_flush_loop, name='qa-flush', daemon=True)
+    _flush_thread.start()
+    atexit.register(_flush_now)
+
+
+def _flush_loop():
+    """
+    Flush queued inserts every FLUSH_INTERVAL seconds (or as soon as a batch fills up)
+    and coalesced use_count increments every USE_COUNT_FLUSH_INTERVAL seconds.
+    """
+    last_use_count_flush = time.monotonic()
+    while True:
+        _flush_requested.wait(FLUSH_INTERVAL)
+        _flush_requested.clear()
+        _flush_inserts()
+
+        if time.monotonic() - last_use_count_flush >= USE_COUNT_FLUSH_INTERVAL:
+            _flush_use_counts()
+            last_use_count_flush = time.monotonic()
+
+
+def _flush_now():
+    """Write every queued insert and use_count increment to the database."""
+    _flush_inserts()
+    _flush_use_counts()
+
+
+def record_use(qa_id):
+    """Count a use of a Q&A pair; the increment is written by the flush thread."""
+    with _lock:
+        _use_count_deltas[qa_id] += 1
+
+
+def _flush_use_counts():
+    """Apply all coalesced use_count increments with a single batched UPDATE."""
+    with _lock:
+        deltas = list(_use_count_deltas.items())
+        _use_count_deltas.clear()
+
+    if not deltas:
+        return
+
+    try:
+        with db_cursor() as cursor:
+            execute_values(
+                cursor,
+                '''
+                UPDATE qa_pairs 
+                SET use_count = use_count + data.delta
+                FROM (VALUES %s) AS data(id, delta)
+                WHERE qa_pairs.id = data.id
+                ''',
+                deltas
+            )
+        logger.debug(f"Flushed use_count increments for {len(deltas)} Q&A pairs")
+
+    except Exception as e:
+        logger.error(f"Error flushing use_count increments: {str(e)}", exc_info=True)
+
+
+def _flush_inserts():
+    """
+    Write all queued Q&A pairs to the database in a single batched INSERT.
+
+    If the database is unreachable the rows are put back on the queue for the next flush,
+    keeping at most MAX_PENDING_INSERTS (the oldest are dropped and logged); if the batch is rejected because of its data, it is retried row by row so that only
+    the offending rows are dropped.
+    """
+    with _lock:
+        rows = list(_pending)
+        _pending.clear()
+
+    if not rows:
+        return
+
+    try:
+        _insert_rows(rows)
+        logger.debug(f"Flushed {len(rows)} new Q&A pairs to the database")
+
+    except (psycopg2.OperationalError, psycopg2.InterfaceError, PoolError) as e:
+        with _lock:
+            _pending.extendleft(reversed(rows))
+            dropped = [_pending.popleft() for _ in range(len(_pending) - MAX_PENDING_INSERTS)]
+        logger.warning(f"Database unavailable, requeued {len(rows)} Q&A pairs: {str(e)}")
+        if dropped:
+            logger.error(f"Insert queue full, dropped the {len(dropped)} oldest Q&A pairs: "
+                         f"{[row[0] for row in dropped[:10]]}")
+
+    except (psycopg2.DataError, psycopg2.IntegrityError, ValueError) as e:
+        logger.warning(f"Batch of {len(rows)} Q&A pairs rejected, retrying row by row: {str(e)}")
+        for row in rows:
+            try:
+                _insert_rows([row])
+            except (psycopg2.DataError, psycopg2.IntegrityError, ValueError) as e:
+                logger.error(f"Dropping queued Q&A pair for {row[0]!r}: {str(e)}")
+            except Exception as e:
+                with _lock:
+                    _pending.append(row)
+                logger.warning(f"Requeued Q&A pair for {row[0]!r}: {str(e)}")
+
+    except Exception as e:
+        logger.error(f"Error flushing {len(rows)} queued Q&A pairs: {str(e)}", exc_info=True)
+
+
+def _insert_rows(rows):
+    """INSERT queued Q&A rows in one transaction and record them in the caches."""
+    with db_cursor() as cursor:
+        execute_values(
+            cursor,
+            '''
+            INSERT INTO qa_pairs 
+            (query, query_hash, query_keywords, clean_query, response,
+             use_count, query_type) 
+            VALUES %s
+            ''',
+            rows,
+            page_size=FLUSH_BATCH_SIZE
+        )
+    _bloom_add(row[1] for row in rows)
+    invalidate_result_cache()
+
+
+def _get_cached_result(query_hash):
+    """Return a fresh cached match result for a query hash, or None."""
+    with _result_cache_lock:
+        entry = _result_cache.get(query_hash)
+        if entry is None:
+            return None
+
+        expires_at, result = entry
+        if expires_at < time.monotonic():
+            del _result_cache[query_hash]
+            return None
+
+        _result_cache.move_to_end(query_hash)
+        return result
+
+
+def _cache_result(query_hash, result, generation):
+    """Cache a match result unless the stored answers changed while it was computed."""
+    with _result_cache_lock:
+        if generation != _result_cache_generation:
+            return
+
+        _result_cache[query_hash] = (time.monotonic() + RESULT_CACHE_TTL, result)
+        _result_cache.move_to_end(query_hash)
+        while len(_result_cache) > RESULT_CACHE_SIZE:
+            _result_cache.popitem(last=False)
+
+
+def invalidate_result_cache():
+    """Drop all cached match results after stored answers change."""
+    global _result_cache_generation
+    with _result_cache_lock:
+        _result_cache_generation += 1
+        _result_cache.clear()
+
+
+def load_hash_bloom(cursor):
+    """Fill the query hash Bloom filter from every stored Q&A pair."""
+    global _hash_bloom_ready
+    cursor.execute('SELECT query_hash FROM qa_pairs WHERE length(query_hash) = 32')
+    _bloom_add(row[0] for row in cursor)
+    _hash_bloom_ready = True
+    logger.debug(f"Loaded {cursor.rowcount} query hashes into the Bloom filter")
+
+
+def _bloom_positions(query_hash):
+    """Derive the filter's bit positions from the two halves of an xxHash3-128 hex digest."""
+    h1 = int(query_hash[:16], 16)
+    h2 = int(query_hash[16:], 16) | 1
+    return [(h1 + i * h2) % BLOOM_BITS for i in range(BLOOM_HASHES)]
+
+
+def _bloom_add(query_hashes):
+    """Record query hashes as stored."""
+    with _hash_bloom_lock:
+        for query_hash in query_hashes:
+            for pos in _bloom_positions(query_hash):
+                _hash_bloom[pos >> 3] |= 1 << (pos & 7)
+
+
+def maybe_stored_hash(query_hash):
+    """Return False only when no stored Q&A pair can have this query hash."""
+    if not _hash_bloom_ready:
+        return True
+    return all(_hash_bloom[pos >> 3] & (1 << (pos & 7)) for pos in _bloom_positions(query_hash))
+
+
+def migrate_query_hashes(cursor):
+    """
+    One-shot migration of legacy SHA-256 query hashes to xxHash3-128.
+
+    Rows already keyed with the 32-character xxHash digest are left alone,
+    so running this on every startup is cheap once the table is migrated.
+    """
+    cursor.execute('SELECT id, query FROM qa_pairs WHERE length(query_hash) <> 32')
+    legacy_rows = cursor.fetchall()
+
+    if not legacy_rows:
+        return
+
+    cursor.executemany(
+        'UPDATE qa_pairs SET query_hash = %s WHERE id = %s',
+        [(_qhash(query.lower()), qa_id) for qa_id, query in legacy_rows]
+    )
+    logger.info(f"Migrated {len(legacy_rows)} query hashes to xxHash3")
+
+
+def backfill_query_features(cursor):
+    """Populate the precomputed cleaned query for rows stored without it."""
+    cursor.execute('SELECT id, query FROM qa_pairs WHERE clean_query IS NULL')
+    rows = cursor.fetchall()
+
+    if not rows:
+        return
+
+    cursor.executemany(
+        'UPDATE qa_pairs SET clean_query = %s WHERE id = %s',
+        [(analyze_query(query)[1], qa_id) for qa_id, query in rows]
+    )
+    logger.info(f"Backfilled cleaned queries for {len(rows)} Q&A pairs")
+
+
+def store_qa_pair(query, response, query_type='informational',
+                  precomputed_similar=None, precomputed_confidence=0.0):
     """
     Store a new Q&A pair in the database with improved metadata.
     Includes quality verification to prevent storing invalid data.
@@ -105,6 +513,9 @@ def store_qa_pair(query, response, query_type='informational'):
         query (str): The user's question
         response (str): The answer/response
         query_type (str): The type of query (informational, person, location, etc.)
+        precomputed_similar (tuple): (qa_id, response) of the best match the caller
+            already looked up for this query, to skip a second similarity search
+        precomputed_confidence (float): Score of precomputed_similar
     """
     try:
         # STEP 1: Quality verification to prevent storing invalid data
@@ -112,125 +523,98 @@ def store_qa_pair(query, response, query_type='informational'):
             logger.warning(f"Rejected low-quality Q&A pair. Query: {query[:50]}...")
             return False
 
-        # Generate a hash for the query to help with exact matching
-        query_hash = hashlib.sha256(query.lower().encode()).hexdigest()
-
-        # Extract meaningful keywords for better search
-        clean_q = clean_text(query.lower())
-        query_keywords = extract_keywords(clean_q)
+        # Hash the query for exact matching and extract keywords (memoized per query)
+        query_hash, clean_q, query_keywords = analyze_query(query)
 
-        # Connect to database
-        conn = get_connection()
-        cursor = conn.cursor()
+        responses_changed = False
 
-        # Check if exact query hash already exists
-        cursor.execute(
-            'SELECT id, use_count, response FROM qa_pairs WHERE query_hash = %s',
-            (query_hash,)
-        )
-
-        exact_match = cursor.fetchone()
-
-        if exact_match:
-            # STEP 2: Quality check - is the new response better than existing one?
-            qa_id, use_count, existing_response = exact_match
+        with db_cursor() as cursor:
+            _ensure_prepared(cursor)
 
-            # Only update if new response is higher quality or significantly different
-            if compare_response_quality(existing_response, response):
-                use_count += 1
+            # Check if exact query hash already exists (skipped for hashes never stored)
+            exact_match = None
+            if maybe_stored_hash(query_hash):
+                cursor.execute('EXECUTE qa_by_hash (%s)', (query_hash,))
+                exact_match = cursor.fetchone()
 
-                cursor.execute(
-                    '''
-                    UPDATE qa_pairs 
-                    SET response = %s, 
-                        updated_at = %s, 
-                        use_count = %s,
-                        query_type = %s
-                    WHERE id = %s
-                    ''',
-                    (response, datetime.now().isoformat(), use_count, query_type, qa_id)
-                )
-                logger.debug(f"Updated existing Q&A pair with better response (used {use_count} times)")
-            else:
-                # Just increment usage count without changing response
-                cursor.execute(
-                    '''
-                    UPDATE qa_pairs 
-                    SET use_count = use_count + 1
-                    WHERE id = %s
-                    ''',
-                    (qa_id,)
-                )
-                logger.debug(f"Kept existing response but incremented usage count")
-        else:
-            # Check for very similar query using keyword matching
-            similar_query, confidence = find_similar_query(query, threshold=0.85)
+            if exact_match:
+                # STEP 2: Quality check - is the new response better than existing one?
+                qa_id, use_count, existing_response = exact_match
 
-            if similar_query and confidence > 0.85:
-                # Get the existing response for comparison
-                cursor.execute(
-                    'SELECT response FROM qa_pairs WHERE query = %s',
-                    (similar_query,)
-                )
-                similar_result = cursor.fetchone()
-                existing_response = similar_result[0] if similar_result else None
+                # Only update if new response is higher quality or significantly different
+                if compare_response_quality(existing_response, response):
+                    use_count += 1
 
-                # STEP 3: Quality check for similar query update
-                if existing_response and compare_response_quality(existing_response, response):
-                    logger.debug(f"Found similar query with confidence {confidence:.2f}")
                     cursor.execute(
                         '''
                         UPDATE qa_pairs 
                         SET response = %s, 
-                            updated_at = %s,
-                            use_count = use_count + 1,
+                            updated_at = CURRENT_TIMESTAMP, 
+                            use_count = %s,
                             query_type = %s
-                        WHERE query = %s
-                        RETURNING use_count
+                        WHERE id = %s
                         ''',
-                        (response, datetime.now().isoformat(), query_type, similar_query)
+                        (response, use_count, query_type, qa_id)
                     )
-                    result = cursor.fetchone()
-                    updated_count = result[0] if result else 1
-                    logger.debug(f"Updated similar Q&A pair with better response (used {updated_count} times)")
+                    responses_changed = True
+                    logger.debug(f"Updated existing Q&A pair with better response (used {use_count} times)")
                 else:
-                    # Just increment the usage count
-                    cursor.execute(
-                        '''
-                        UPDATE qa_pairs 
-                        SET use_count = use_count + 1
-                        WHERE query = %s
-                        ''',
-                        (similar_query,)
-                    )
-                    logger.debug(f"Kept existing response for similar query but incremented usage count")
+                    # Just increment usage count without changing response
+                    record_use(qa_id)
+                    logger.debug(f"Kept existing response but incremented usage count")
             else:
-                # STEP 4: Final verification before adding completely new Q&A pair
-                # Only store meaningful queries and responses
-                if len(query.split()) >= 3 and len(response) >= 100:
-                    cursor.execute(
-                        '''
-                        INSERT INTO qa_pairs 
-                        (query, query_hash, query_keywords, response, created_at, updated_at, use_count, query_type) 
-                        VALUES (%s, %s, %s, %s, %s, %s, %s, %s)
-                        ''',
-                        (
-                            query,
-                            query_hash,
-                            query_keywords,
-                            response,
-                            datetime.now().isoformat(),
-                            datetime.now().isoformat(),
-                            1,
-                            query_type
+                # Check for very similar query using keyword matching, unless the
+                # caller already did so for this request
+                if precomputed_similar is not None:
+                    similar_id, existing_response = precomputed_similar
+                    confidence = precomputed_confidence
+                else:
+                    similar_id, existing_response, confidence = find_best_match(query)
+
+                if similar_id is not None and confidence > 0.85:
+                    # STEP 3: Quality check for similar query update
+                    if existing_response and compare_response_quality(existing_response, response):
+                        logger.debug(f"Found similar query with confidence {confidence:.2f}")
+                        cursor.execute(
+                            '''
+                            UPDATE qa_pairs 
+                            SET response = %s, 
+                                updated_at = CURRENT_TIMESTAMP,
+                                use_count = use_count + 1,
+                                query_type = %s
+                            WHERE id = %s
+                            RETURNING use_count
+                            ''',
+                            (response, query_type, similar_id)
                         )
-                    )
-                    logger.debug(f"Created new validated Q&A pair: {query[:50]}...")
+                        result = cursor.fetchone()
+                        updated_count = result[0] if result else 1
+                        responses_changed = True
+                        logger.debug(f"Updated similar Q&A pair with better response (used {updated_count} times)")
+                    else:
+                        # Just increment the usage count
+                        record_use(similar_id)
+                        logger.debug(f"Kept existing response for similar query but incremented usage count")
                 else:
-                    logger.warning(f"Rejected too short query or response. Query: {query}")
-
-        conn.commit()
-        release_connection(conn)
+                    # STEP 4: Final verification before adding completely new Q&A pair
+                    # Only store meaningful queries and responses
+                    if len(query.split()) >= 3 and len(response) >= 100:
+                        # Queue the INSERT; the flush thread writes new pairs in batches
+                        with _lock:
+                            _pending.append(
+                                (query, query_hash, list(query_keywords), clean_q, response, 1, query_type)
+                            )
+                            batch_ready = len(_pending) >= FLUSH_BATCH_SIZE
+
+                        if batch_ready:
+                            _flush_requested.set()
+                        logger.debug(f"Queued new validated Q&A pair: {query[:50]}...")
+                    else:
+                        logger.warning(f"Rejected too short query or response. Query: {query}")
+
+        # Cached match results may now point at an outdated response
+        if responses_changed:
+            invalidate_result_cache()
         return True
 
     except Exception as e:
@@ -254,25 +638,13 @@ def is_valid_qa_pair(query, response):
         return False
 
     # Check 2: Query must contain actual question words or be a clear command
-    question_indicators = ['what', 'who', 'where', 'when', 'why', 'how', 'which', 'can', 'is', 'are', 'will', 'should',
-                           'did', 'does', 'do']
-    command_indicators = ['tell', 'explain', 'describe', 'show', 'list', 'find', 'search', 'get', 'give']
-
     query_lower = query.lower()
-    has_question_indicator = any(indicator in query_lower for indicator in question_indicators)
-    has_command_indicator = any(indicator in query_lower for indicator in command_indicators)
-
-    if not (has_question_indicator or has_command_indicator):
+    if not (_QUESTION_RE.search(query_lower) or _COMMAND_RE.search(query_lower)):
         return False
 
     # Check 3: Response must not be an error message
-    error_indicators = [
-        'error', 'sorry', 'couldn\'t find', 'no information', 'no results',
-        'unable to', 'failed to', 'cannot', 'not available'
-    ]
-
     response_lower = response.lower()
-    if any(indicator in response_lower for indicator in error_indicators) and len(response) < 200:
+    if len(response) < 200 and _ERROR_RE.search(response_lower):
         return False
 
     # Check 4: Response should contain substantial text content
@@ -281,8 +653,8 @@ def is_valid_qa_pair(query, response):
 
     # Check 5: Response content should be relevant to query
     # Extract keywords from both query and response
-    query_words = set(extract_words(clean_text(query_lower)))
-    response_words = set(extract_words(clean_text(response_lower)))
+    query_words = extract_words(query_lower)
+    response_words = extract_words(response_lower)
 
     # Calculate keyword overlap
     if len(query_words) > 0:
@@ -324,15 +696,14 @@ def compare_response_quality(existing_response, new_response):
         return True
 
     # Strategy 3: Structural richness - HTML formatting indicates better structured content
-    existing_html_tags = len(re.findall(r'<[^>]+>', existing_response))
-    new_html_tags = len(re.findall(r'<[^>]+>', new_response))
+    new_html_tags = count_html_tags(new_response)
 
-    if new_html_tags > existing_html_tags * 1.5:
+    if new_html_tags and new_html_tags > count_html_tags(existing_response) * 1.5:
         return True
 
     # Strategy 4: Include basic semantic analysis
-    existing_words = set(extract_words(clean_text(existing_response.lower())))
-    new_words = set(extract_words(clean_text(new_response.lower())))
+    existing_words = extract_words(existing_response.lower())
+    new_words = extract_words(new_response.lower())
 
     # If new response contains substantially more unique words
     if len(new_words) > len(existing_words) * 1.3:
@@ -342,6 +713,13 @@ def compare_response_quality(existing_response, new_response):
     return False
 
 
+def count_html_tags(text):
+    """Count HTML tags in text without building a list of the matches."""
+    if '<' not in text:
+        return 0
+    return sum(1 for _ in _HTML_RE.finditer(text))
+
+
 def find_similar_query(query, threshold=0.7):
     """
     Find a semantically similar query in the database using improved matching.
@@ -353,200 +731,166 @@ def find_similar_query(query, threshold=0.7):
     Returns:
         tuple: (response, confidence) if found, else (None, 0)
     """
+    qa_id, best_match, best_score = find_best_match(query)
+
+    # Return the best match if above threshold
+    if best_match and best_score >= threshold:
+        logger.debug(f"Found similar query with confidence {best_score:.2f}")
+        record_use(qa_id)
+        return best_match, best_score
+    else:
+        logger.debug(f"No similar query found above threshold (best: {best_score:.2f})")
+        return None, best_score
+
+
+def find_best_match(query):
+    """
+    Find the stored Q&A pair that best matches a query, ranked inside PostgreSQL.
+
+    The score combines keyword Jaccard similarity with pg_trgm trigram similarity
+    of the cleaned queries, scaled by a length penalty, so only the single best
+    row is sent back instead of every candidate. Rows with less than half or more
+    than twice as many keywords are pruned before scoring, since their keyword
+    similarity can be at most 0.5. Results are cached in-process
+    for RESULT_CACHE_TTL seconds so repeated queries skip the database.
+    
+    Args:
+        query (str): The query to find matches for
+        
+    Returns:
+        tuple: (qa_id, response, score) of the best match, else (None, None, 0)
+    """
     try:
-        # Generate hash for exact matching
-        query_hash = hashlib.sha256(query.lower().encode()).hexdigest()
+        # Hash for exact matching (also the result cache key)
+        query_hash, _, _ = analyze_query(query)
 
-        # Clean query and extract keywords
-        clean_q = clean_text(query.lower())
-        query_keywords = extract_keywords(clean_q)
+        cached = _get_cached_result(query_hash)
+        if cached is not None:
+            logger.debug(f"Using cached match result for query")
+            return cached
 
-        if not query_keywords:
-            return None, 0
+        generation = _result_cache_generation
+        result = _rank_best_match(query, query_hash)
+        _cache_result(query_hash, result, generation)
+        return result
 
-        # Connect to database
-        conn = get_connection()
-        cursor = conn.cursor()
+    except Exception as e:
+        logger.error(f"Error finding similar query: {str(e)}", exc_info=True)
+        return None, None, 0
 
-        # First check for exact hash match
-        cursor.execute(
-            'SELECT query, response FROM qa_pairs WHERE query_hash = %s ORDER BY use_count DESC LIMIT 1',
-            (query_hash,)
-        )
-        exact_match = cursor.fetchone()
+
+def _rank_best_match(query, query_hash):
+    """Look up the best match for a query in the database (uncached)."""
+    # Clean query and extract keywords (memoized per query)
+    _, clean_q, query_keywords = analyze_query(query)
+
+    if not query_keywords:
+        return None, None, 0
+
+    with db_cursor() as cursor:
+        _ensure_prepared(cursor)
+
+        # First check for exact hash match, unless the hash was never stored
+        exact_match = None
+        if maybe_stored_hash(query_hash):
+            cursor.execute('EXECUTE qa_by_hash (%s)', (query_hash,))
+            exact_match = cursor.fetchone()
 
         if exact_match:
-            db_query, db_response = exact_match
-            release_connection(conn)
+            qa_id, _, db_response = exact_match
             logger.debug(f"Found exact hash match for query")
-            return db_response, 1.0
-
-        # Next, find records that share keywords
-        keywords_param = '{' + ','.join(query_keywords) + '}'
+            return qa_id, db_response, 1.0
 
+        # Next, score the records that share keywords and keep only the best one
         cursor.execute(
-            '''
-            SELECT query, response, query_keywords
-            FROM qa_pairs
-            WHERE query_keywords && %s
-            ORDER BY use_count DESC, updated_at DESC
-            LIMIT 50
-            ''',
-            (keywords_param,)
+            'EXECUTE qa_best_match (%s, %s, %s)',
+            (list(query_keywords), clean_q, len(clean_q))
         )
 
-        potential_matches = cursor.fetchall()
-        release_connection(conn)
+        best = cursor.fetchone()
 
-        if not potential_matches:
-            return None, 0
-
-        # Compare similarity using multiple metrics
-        best_match = None
-        best_score = 0
-
-        # Get n-grams from the query for comparison
-        query_bigrams = get_ngrams(clean_q, 2)
-        query_trigrams = get_ngrams(clean_q, 3)
-        query_keywords_set = set(query_keywords)
-
-        for db_query, db_response, db_keywords in potential_matches:
-            # Skip if no overlap in keywords at all
-            db_keywords_set = set(db_keywords)
-            keyword_overlap = len(query_keywords_set.intersection(db_keywords_set))
-
-            if keyword_overlap == 0:
-                continue
-
-            # Calculate keyword similarity (Jaccard similarity)
-            keyword_union = len(query_keywords_set.union(db_keywords_set))
-            keyword_similarity = keyword_overlap / keyword_union if keyword_union > 0 else 0
-
-            # Calculate n-gram similarity
-            clean_db_query = clean_text(db_query.lower())
-            db_bigrams = get_ngrams(clean_db_query, 2)
-            db_trigrams = get_ngrams(clean_db_query, 3)
-
-            # Calculate bigram overlap
-            bigram_overlap = len(query_bigrams.intersection(db_bigrams))
-            bigram_union = len(query_bigrams.union(db_bigrams))
-            bigram_similarity = bigram_overlap / bigram_union if bigram_union > 0 else 0
-
-            # Calculate trigram overlap
-            trigram_overlap = len(query_trigrams.intersection(db_trigrams))
-            trigram_union = len(query_trigrams.union(db_trigrams))
-            trigram_similarity = trigram_overlap / trigram_union if trigram_union > 0 else 0
-
-            # Calculate combined similarity score with weights
-            # Give more weight to keywords (semantic) than to n-grams (syntactic)
-            combined_score = (
-                    0.5 * keyword_similarity +
-                    0.3 * bigram_similarity +
-                    0.2 * trigram_similarity
-            )
+        if not best:
+            return None, None, 0
 
-            # Apply length penalty (larger difference in length = lower score)
-            len_ratio = min(len(clean_q), len(clean_db_query)) / max(len(clean_q), len(clean_db_query))
-            final_score = combined_score * len_ratio
+        qa_id, db_response, score = best
+        return qa_id, db_response, score or 0
 
-            if final_score > best_score:
-                best_score = final_score
-                best_match = db_response
 
-        # Return the best match if above threshold
-        if best_score >= threshold:
-            logger.debug(f"Found similar query with confidence {best_score:.2f}")
-            return best_match, best_score
-        else:
-            logger.debug(f"No similar query found above threshold (best: {best_score:.2f})")
-            return None, best_score
+def _qhash(text):
+    """Fingerprint a query for exact matching (non-cryptographic)."""
+    return xxhash.xxh3_128_hexdigest(text)
 
-    except Exception as e:
-        logger.error(f"Error finding similar query: {str(e)}", exc_info=True)
-        return None, 0
+
+@lru_cache(maxsize=4096)
+def analyze_query(query):
+    """
+    Hash and clean a query and derive its keywords, memoized per raw query
+    so a request that both looks up and stores a query does this work once.
+
+    Returns:
+        tuple: (query_hash, clean_query, keywords) as immutable values
+    """
+    lowered = query.lower()
+    clean_q = clean_text(lowered)
+    return _qhash(lowered), clean_q, tuple(extract_keywords(clean_q))
 
 
 def clean_text(text):
     """Clean and normalize text for comparison."""
-    # Remove special characters and extra spaces
-    text = re.sub(r'[^\w\s]', ' ', text)
-    text = re.sub(r'\s+', ' ', text).strip()
-    return text
+    # Remove runs of special characters, then collapse whitespace with split/join
+    return ' '.join(_NONWORD_RE.sub(' ', text).split())
 
 
 def extract_keywords(text):
     """Extract meaningful keywords from text."""
     # Split by spaces and filter out stop words and very short words
-    stop_words = {'the', 'a', 'an', 'and', 'or', 'but', 'is', 'are', 'was', 'were',
-                  'in', 'on', 'at', 'to', 'for', 'with', 'by', 'about', 'like',
-                  'from', 'of', 'as', 'what', 'when', 'where', 'who', 'why', 'how',
-                  'can', 'could', 'would', 'should', 'may', 'might', 'must', 'need',
-                  'have', 'has', 'had', 'do', 'does', 'did', 'will', 'shall', 'should',
-                  'this', 'that', 'these', 'those', 'them', 'they', 'their', 'we', 'us',
-                  'our', 'ours', 'you', 'your', 'yours', 'he', 'him', 'his', 'she',
-                  'her', 'hers', 'it', 'its', 'be', 'been', 'being', 'am'}
-
-    words = [word for word in text.split() if word not in stop_words and len(word) > 2]
-
-    # Get most frequent words for better relevance
-    if len(words) > 5:
-        word_counts = Counter(words)
-        keywords = [word for word, _ in word_counts.most_common(15)]
-    else:
-        keywords = words
+    words = [word for word in text.split() if word not in _STOP_WORDS and len(word) > 2]
+
+    # Keywords are matched as a set, so order only matters when capping:
+    # rank by frequency just for the rare queries with more than 15 distinct words
+    keywords = list(dict.fromkeys(words))
+    if len(keywords) > 15:
+        keywords = [word for word, _ in Counter(words).most_common(15)]
 
     return keywords
 
 
 def extract_words(text):
-    """Extract all meaningful words from text."""
-    stop_words = {'the', 'a', 'an', 'and', 'or', 'but', 'is', 'are', 'was', 'were',
-                  'in', 'on', 'at', 'to', 'for', 'with', 'by', 'about', 'like',
-                  'from', 'of', 'as', 'what', 'when', 'where', 'who', 'why', 'how'}
-
-    words = [word for word in text.split() if word not in stop_words and len(word) > 2]
-    return words
-
-
-def get_ngrams(text, n):
-    """Generate character n-grams from text."""
-    return set(' '.join([text[i:i + n] for i in range(len(text) - n + 1)]))
+    """Extract the distinct meaningful words from lowercased text (raw or cleaned)."""
+    # Word runs are exactly the tokens clean_text() + split() would produce
+    return {word for word in _WORD_RE.findall(text) if len(word) > 2 and word not in _STOP_WORDS_SMALL}
 
 
 def get_database_stats():
     """Get statistics about the QA database."""
     try:
-        conn = get_connection()
-        cursor = conn.cursor()
-
-        # Get total count of QA pairs
-        cursor.execute('SELECT COUNT(*) FROM qa_pairs')
-        result = cursor.fetchone()
-        total_count = result[0] if result else 0
-
-        # Get most used QA pairs
-        cursor.execute(
-            '''
-            SELECT query, use_count 
-            FROM qa_pairs 
-            ORDER BY use_count DESC 
-            LIMIT 5
-            '''
-        )
-        most_used = cursor.fetchall()
+        with db_cursor() as cursor:
+            # Get total count of QA pairs
+            cursor.execute('SELECT COUNT(*) FROM qa_pairs')
+            result = cursor.fetchone()
+            total_count = result[0] if result else 0
 
-        # Get count by query type
-        cursor.execute(
-            '''
-            SELECT query_type, COUNT(*) 
-            FROM qa_pairs 
-            GROUP BY query_type 
-            ORDER BY COUNT(*) DESC
-            '''
-        )
-        type_counts = cursor.fetchall()
+            # Get most used QA pairs
+            cursor.execute(
+                '''
+                SELECT query, use_count 
+                FROM qa_pairs 
+                ORDER BY use_count DESC 
+                LIMIT 5
+                '''
+            )
+            most_used = cursor.fetchall()
 
-        release_connection(conn)
+            # Get count by query type
+            cursor.execute(
+                '''
+                SELECT query_type, COUNT(*) 
+                FROM qa_pairs 
+                GROUP BY query_type 
+                ORDER BY COUNT(*) DESC
+                '''
+            )
+            type_counts = cursor.fetchall()
 
         return {
             "total_qa_pairs": total_count,
@@ -1,6 +1,14 @@
 import os
+import re
+import json
+import time
+import uuid
 import logging
-from flask import Flask, request, render_template, jsonify, session
+import threading
+import redis
+from concurrent.futures import ThreadPoolExecutor
+from flask import Blueprint, Flask, request, render_template, jsonify, session
+from flask_session import Session
 from SecuLexAi import database
 from SecuLexAi import search
 from SecuLexAi import model
@@ -9,15 +17,60 @@ from SecuLexAi import model
 logging.basicConfig(level=logging.DEBUG)
 logger = logging.getLogger(__name__)
 
-# Initialize Flask app
-app = Flask(__name__)
-app.secret_key = os.environ.get("SESSION_SECRET", "default_secret_key_for_development")
+# Query type indicators, checked in priority order (substring semantics)
+QUERY_TYPE_PATTERNS = (
+    ("person", re.compile(r'who|person|people|someone')),
+    ("location", re.compile(r'where|location|place|country|city')),
+    ("time", re.compile(r'when|date|time|year|month|day')),
+    ("reason", re.compile(r'why|reason|cause|because')),
+    ("process", re.compile(r'how|process|steps|way|method|procedure')),
+    ("comparison", re.compile(r'difference|compare|versus|vs|similarities')),
+    ("recommendation", re.compile(r'best|top|most|recommend|suggestion|should')),
+)
 
-# Ensure the database is initialized
-database.init_db()
+# Number of chat messages (user and assistant) kept in the session
+MAX_CHAT_HISTORY = 50
 
+# Web search + summarization runs on these workers so a miss doesn't hold a request thread
+_executor = ThreadPoolExecutor(max_workers=16, thread_name_prefix="ask-worker")
+TASK_RESULT_TTL = 600  # seconds a task's state is kept after its last update
+TASK_KEY_PREFIX = "seculex:task:"
 
-@app.route('/')
+# Shared Redis (sessions and task state) when REDIS_URL is set. Task state must live there
+# when running several gunicorn workers, since a poll may land on any of them; without
+# Redis it is kept in this process, which only works with a single worker. Set by create_app.
+_redis = None
+_tasks = {}  # task_id -> (state, updated_at), used when Redis is not configured
+_tasks_lock = threading.Lock()
+
+# Routes are registered on the app by create_app, so importing this module has no side
+# effects (parse-pool worker processes re-import the launching module)
+bp = Blueprint('chat', __name__)
+
+
+def create_app():
+    """Create the Flask app: connect to Redis if configured and initialize the database."""
+    global _redis
+
+    app = Flask(__name__)
+    app.secret_key = os.environ.get("SESSION_SECRET", "default_secret_key_for_development")
+
+    # Keep sessions server-side in Redis when available so the chat history is not
+    # re-serialized into a cookie on every response
+    if os.environ.get("REDIS_URL"):
+        _redis = redis.from_url(os.environ["REDIS_URL"])
+        app.config['SESSION_TYPE'] = 'redis'
+        app.config['SESSION_REDIS'] = _redis
+        Session(app)
+
+    # Ensure the database is initialized
+    database.init_db()
+
+    app.register_blueprint(bp)
+    return app
+
+
+@bp.route('/')
 def index():
     """Render the main chat interface."""
     # Create a chat history in session if it doesn't exist
@@ -27,13 +80,13 @@ def index():
     return render_template('index.html', chat_history=session['chat_history'])
 
 
-@app.route('/learning')
+@bp.route('/learning')
 def learning_stats():
     """Render the learning statistics page."""
     return render_template('stats.html')
 
 
-@app.route('/ask', methods=['POST'])
+@bp.route('/ask', methods=['POST'])
 def ask():
     """Process user query and return response."""
     try:
@@ -50,58 +103,158 @@ def ask():
         logger.debug(f"Query type identified as: {query_type}")
 
         # Step 1: Check if we have a similar query in our database
-        db_response, confidence = database.find_similar_query(query)
+        qa_id, db_response, confidence = database.find_best_match(query)
 
         # If we found a similar query with high confidence, return that response
         if db_response and confidence >= 0.7:
             logger.debug(f"Found answer in database with confidence {confidence:.2f}")
-            response = db_response
-            source = "database"
+            database.record_use(qa_id)
 
-            # Log usage statistics
-            add_metadata = {
-                'source': 'database',
-                'confidence': f"{confidence:.2f}"
-            }
-        else:
-            # Step 2: If not in database, search the web
-            logger.debug("Searching the web for information...")
-            search_results = search.search_web(query)
-
-            # Step 3: Summarize the search results
-            logger.debug("Summarizing search results...")
-            response = model.summarize(query, search_results)
-            source = "web"
-
-            # Step 4: Store the new Q&A pair in the database with improved metadata
-            logger.debug(f"Storing new Q&A pair in database with type: {query_type}...")
-            database.store_qa_pair(query, response, query_type)
-
-            # Log usage statistics
-            add_metadata = {
-                'source': 'web',
-                'query_type': query_type
-            }
-
-        # Update chat history in session
-        chat_entry = {'role': 'user', 'content': query}
-        session['chat_history'] = session.get('chat_history', []) + [chat_entry]
-
-        chat_entry = {'role': 'assistant', 'content': response, 'source': source}
-        session['chat_history'] = session.get('chat_history', []) + [chat_entry]
-        session.modified = True
+            append_chat_history(
+                {'role': 'user', 'content': query},
+                {'role': 'assistant', 'content': db_response, 'source': 'database'}
+            )
 
-        return jsonify({
-            'response': response,
-            'source': source,
-            'metadata': add_metadata
-        })
+            return jsonify({
+                'response': db_response,
+                'source': 'database',
+                'metadata': {
+                    'source': 'database',
+                    'confidence': f"{confidence:.2f}"
+                }
+            })
+
+        # Step 2: If not in database, search the web in the background and let
+        # the client poll /ask_result for the answer
+        task_id = uuid.uuid4().hex
+        set_task_state(task_id, {'status': 'pending'})
+        future = _executor.submit(
+            handle_web_query, query, query_type, (qa_id, db_response), confidence
+        )
+        future.add_done_callback(lambda future: finish_task(task_id, future))
+
+        append_chat_history({'role': 'user', 'content': query})
+        logger.debug(f"Queued web search task {task_id}")
+
+        return jsonify({'task_id': task_id, 'status': 'pending'}), 202
 
     except Exception as e:
         logger.error(f"Error processing query: {str(e)}", exc_info=True)
         return jsonify({'error': str(e)}), 500
 
 
+@bp.route('/ask_result/<task_id>', methods=['GET'])
+def ask_result(task_id):
+    """Return the answer for a queued web query, or 202 while it is still running."""
+    state = pop_task_state(task_id)
+
+    if state is None:
+        return jsonify({'error': 'Unknown or expired task'}), 404
+
+    if state['status'] == 'pending':
+        return jsonify({'task_id': task_id, 'status': 'pending'}), 202
+
+    if state['status'] == 'error':
+        return jsonify({'error': state['error']}), 500
+
+    response, query_type = state['response'], state['query_type']
+    append_chat_history({'role': 'assistant', 'content': response, 'source': 'web'})
+
+    return jsonify({
+        'response': response,
+        'source': 'web',
+        'metadata': {
+            'source': 'web',
+            'query_type': query_type
+        }
+    })
+
+
+def handle_web_query(query, query_type, similar, confidence):
+    """
+    Answer a query from the web and store it; runs on the background executor.
+
+    Returns:
+        tuple: (response, query_type)
+    """
+    # Step 3: Search the web and summarize the results
+    logger.debug("Searching the web for information...")
+    search_results = search.search_web(query)
+
+    logger.debug("Summarizing search results...")
+    response = model.summarize(query, search_results)
+
+    # Step 4: Store the new Q&A pair in the database with improved metadata
+    logger.debug(f"Storing new Q&A pair in database with type: {query_type}...")
+    database.store_qa_pair(
+        query, response, query_type,
+        precomputed_similar=similar,
+        precomputed_confidence=confidence
+    )
+
+    return response, query_type
+
+
+def finish_task(task_id, future):
+    """Record the outcome of a background web query; runs as the future's done callback."""
+    try:
+        response, query_type = future.result()
+        state = {'status': 'done', 'response': response, 'query_type': query_type}
+    except Exception as e:
+        logger.error(f"Error processing query: {str(e)}", exc_info=True)
+        state = {'status': 'error', 'error': str(e)}
+
+    set_task_state(task_id, state)
+
+
+def set_task_state(task_id, state):
+    """Store a task's state, in Redis if configured, expiring after TASK_RESULT_TTL."""
+    if _redis is not None:
+        _redis.set(TASK_KEY_PREFIX + task_id, json.dumps(state), ex=TASK_RESULT_TTL)
+        return
+
+    with _tasks_lock:
+        prune_expired_tasks()
+        _tasks[task_id] = (state, time.monotonic())
+
+
+def pop_task_state(task_id):
+    """Return a task's state, removing it once finished; None if unknown or expired."""
+    if _redis is not None:
+        key = TASK_KEY_PREFIX + task_id
+        state = _redis.get(key)
+        if state is None:
+            return None
+        state = json.loads(state)
+        if state['status'] != 'pending':
+            _redis.delete(key)
+        return state
+
+    with _tasks_lock:
+        prune_expired_tasks()
+        task = _tasks.get(task_id)
+        if task is None:
+            return None
+        state, _ = task
+        if state['status'] != 'pending':
+            del _tasks[task_id]
+        return state
+
+
+def prune_expired_tasks():
+    """Drop in-process tasks not updated within TASK_RESULT_TTL (caller holds _tasks_lock)."""
+    cutoff = time.monotonic() - TASK_RESULT_TTL
+    expired = [task_id for task_id, (_, updated_at) in _tasks.items() if updated_at < cutoff]
+    for task_id in expired:
+        del _tasks[task_id]
+
+
+def append_chat_history(*entries):
+    """Append messages to the session chat history, keeping only the most recent ones."""
+    chat_history = session.get('chat_history', []) + list(entries)
+    session['chat_history'] = chat_history[-MAX_CHAT_HISTORY:]
+
+
 def identify_query_type(query):
     """
     Identify the type of query to improve matching and categorization.
@@ -113,32 +266,21 @@ def identify_query_type(query):
     query_topic = query.lower()
 
     # Question classification - detect question type
-    if any(word in query_topic for word in ['who', 'person', 'people', 'someone']):
-        return "person"
-    elif any(word in query_topic for word in ['where', 'location', 'place', 'country', 'city']):
-        return "location"
-    elif any(word in query_topic for word in ['when', 'date', 'time', 'year', 'month', 'day']):
-        return "time"
-    elif any(word in query_topic for word in ['why', 'reason', 'cause', 'because']):
-        return "reason"
-    elif any(word in query_topic for word in ['how', 'process', 'steps', 'way', 'method', 'procedure']):
-        return "process"
-    elif any(word in query_topic for word in ['difference', 'compare', 'versus', 'vs', 'similarities']):
-        return "comparison"
-    elif any(word in query_topic for word in ['best', 'top', 'most', 'recommend', 'suggestion', 'should']):
-        return "recommendation"
-    else:
-        return "informational"
-
-
-@app.route('/clear_history', methods=['POST'])
+    for query_type, pattern in QUERY_TYPE_PATTERNS:
+        if pattern.search(query_topic):
+            return query_type
+
+    return "informational"
+
+
+@bp.route('/clear_history', methods=['POST'])
 def clear_history():
     """Clear the chat history in the session."""
     session['chat_history'] = []
     return jsonify({'status': 'success'})
 
 
-@app.route('/stats', methods=['GET'])
+@bp.route('/stats', methods=['GET'])
 def get_stats():
     """Get statistics about the database and learning progress."""
     try:
@@ -160,4 +302,4 @@ def get_stats():
 
 
 if __name__ == '__main__':
-    app.run(host='0.0.0.0', port=5000, debug=True)
+    create_app().run(host='0.0.0.0', port=5000, debug=True)
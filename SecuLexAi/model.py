@@ -2,10 +2,14 @@ import os
 import logging
 import re
 import random
-from collections import Counter
+import heapq
+import threading
+from collections import Counter, OrderedDict
+from functools import lru_cache
 import warnings
-import nltk
-from nltk.tokenize import sent_tokenize, word_tokenize
+from html import escape
+import xxhash
+from jinja2 import Environment
 
 # Configure logging
 logging.basicConfig(level=logging.DEBUG)
@@ -14,11 +18,196 @@ logger = logging.getLogger(__name__)
 # Suppress some warnings
 warnings.filterwarnings("ignore", category=UserWarning)
 
-# Try to download NLTK data, but handle it if there's an error
-try:
-    nltk.download('punkt', quiet=True)
-except Exception as e:
-    logger.warning(f"Could not download NLTK data: {str(e)}")
+# Capitalized-name building blocks shared by the entity, city and answer patterns below
+_CAPITALIZED_WORD = r'[A-Z][a-z]+'
+_PROPER_NAME = rf'{_CAPITALIZED_WORD}(?:\s+{_CAPITALIZED_WORD})?'  # One or two capitalized words
+
+# Patterns used on every summarize/format_answer call, compiled once at import time
+_MERGED_SENTENCE_RE = re.compile(r'\.([A-Z])')
+_SCRAPE_NOISE_RE = re.compile(r'From https?://[^\s]+:\s*|\[citation needed\]|\[\d+\]')  # Source URLs, citations
+_SENTENCE_BOUNDARY_RE = re.compile(r'(?<=[.!?])\s+(?=[A-Z0-9"\'(])')
+_SENTENCE_SPLIT_RE = re.compile(r'(?<=[.!?])\s+')
+_WORD_RE = re.compile(r'\w+')
+_DIGIT_RE = re.compile(r'\d')
+_ENTITY_RE = re.compile(rf'{_CAPITALIZED_WORD}(?:\s+{_CAPITALIZED_WORD})+')
+_HIGHLIGHT_TERM_RE = re.compile(rf'\b({_CAPITALIZED_WORD}(?:{_CAPITALIZED_WORD})*)\b')
+_HIGHLIGHT_STOP_WORDS = frozenset({'this', 'that', 'these', 'those', 'there', 'their', 'which', 'where', 'when', 'what'})
+
+# List-like passages; exactly one of the groups captures the bullet text
+_BULLET_RE = re.compile(
+    r'(?:^|\n)(?:\d+\.\s+|\*\s+|:\s+)([A-Z][^.!?]*[.!?])'  # Numbered/bullet points
+    r'|(?:^|\n)(?:First|Second|Third|Finally|Lastly)[,:]?\s+([A-Z][^.!?]*[.!?])'  # Sequence markers
+    r'|(?<=[.!?])\s+([A-Z][^.!?]*? (?:include|includes|are|is|was|were):[^.!?]*[.!?])'  # Definition patterns
+)
+
+# Fact/definition sentences, in the order facts are preferred, matched in one scan. Matches
+# can only begin at a sentence start, so the leading lookbehind skips the other positions
+# instead of rescanning the rest of the sentence from each one (quadratic on long sentences).
+_FACT_VERBS = ('is', 'are', 'was', 'were', 'has', 'have', 'contains', 'includes', 'consists of')
+_FACT_RE = re.compile(r'(?<![^.!?])([^.!?]*? (' + '|'.join(_FACT_VERBS) + r') [^.!?]*?\.)')
+
+_NUMBERED_ITEM_RE = re.compile(r'(?:^|\n|\. )([1-9][0-9]?)[\.|\)]\s+([A-Z][^.!?]+)')
+_BULLET_ITEM_RE = re.compile(r'(?:^|\n)[\*\-•]\s+([A-Z][^.!?]+)')
+_RANKED_CITY_RE = re.compile(
+    rf'({_CAPITALIZED_WORD}(?:\s+{_CAPITALIZED_WORD}){{0,2}})\s+(?:is|was|has been)\s+(?:ranked|rated|known|named|called|considered|recognized)')
+
+_CLEANEST_CITY_PATTERNS = tuple(re.compile(p, re.IGNORECASE) for p in (
+    rf'({_PROPER_NAME})\s+(?:is|has been|was|remains)\s+(?:the|recognized as the|consistently|rated as the)\s+cleanest\s+city',
+    rf'the\s+cleanest\s+city\s+(?:in|of)\s+{_CAPITALIZED_WORD}\s+is\s+({_PROPER_NAME})',
+    rf'({_PROPER_NAME})\s+tops\s+the\s+list\s+of\s+cleanest\s+cities',
+    rf'({_PROPER_NAME})\s+was\s+awarded\s+the\s+title\s+of\s+cleanest\s+city'
+))
+_FIRST_LIST_ITEM_RE = re.compile(rf'(?:1|1st|one|first)[\.\)]\s+({_PROPER_NAME})')
+_COUNTRY_RE = re.compile(r'capital of ([A-Za-z]+)')
+
+_SUPERLATIVES = ("tallest", "highest", "biggest", "largest", "smallest", "shortest")
+# "The tallest <subject> is <Name>", one pattern per superlative: the subject is lazy and
+# bounded, and the name must really be capitalized, so the two parts cannot trade characters.
+# Each word is searched on its own, since in "the tallest building in the largest city is X"
+# the match for one superlative overlaps the match for the other.
+_SUPERLATIVE_PATTERNS = {
+    word: re.compile(
+        rf'(?:the|world\'s|earth\'s)\s+{word}\s+(?P<subject>[^.!?]{{1,200}}?)'
+        rf'\s+is\s+(?:the\s+)?(?P<name>(?-i:{_CAPITALIZED_WORD}(?:\s+{_CAPITALIZED_WORD}){{0,3}}))\b',
+        re.IGNORECASE)
+    for word in _SUPERLATIVES
+}
+
+_RANKING_INFO_RE = re.compile(r'[Tt]he(?:se)? rankings [^.!?]+[.!?]|[Tt]he (?:assessment|survey) [^.!?]+[.!?]')
+
+# Query type indicators, checked in priority order (substring semantics)
+_QUERY_TYPE_PATTERNS = (
+    ("person", re.compile(r'who|person|people|name')),
+    ("location", re.compile(r'where|location|place|country|city')),
+    ("time", re.compile(r'when|date|time|year')),
+    ("quantity", re.compile(r'how many|count|number|total')),
+    ("definition", re.compile(r'what is|meaning|define|definition')),
+    ("ranking", re.compile(r'list|top|best|ranked|rating|cleanest')),
+    ("reason", re.compile(r'why|reason|cause|because')),
+    ("process", re.compile(r'how|process|steps|way|method|procedure')),
+    ("comparison", re.compile(r'difference|compare|versus|vs')),
+)
+_RANKING_RE = re.compile(r'top|best|cleanest|greatest|largest|smallest|highest|lowest|rank|list')
+
+# Question words dropped when deriving a query topic
+_QUESTION_WORDS = frozenset({'what', 'who', 'where', 'when', 'why', 'how', 'is', 'are', 'was', 'were', 'do', 'does', 'did',
+                             'can', 'could', 'would', 'should', 'has', 'have', 'had'})
+
+# Section intros per question type; {topic} is filled with the query topic
+_INTROS = {
+    "person": (
+        "<div class='doc-section'><h3>About {topic}</h3><p>",
+        "<div class='doc-section'><h3>Profile Information</h3><p><strong>Overview: </strong>",
+        "<div class='doc-section'><h3>Research Results</h3><p>"
+    ),
+    "location": (
+        "<div class='doc-section'><h3>Location Information: {topic}</h3><p>",
+        "<div class='doc-section'><h3>Geographical Data</h3><p><strong>Location: </strong>",
+        "<div class='doc-section'><h3>Location Analysis</h3><p>"
+    ),
+    "time": (
+        "<div class='doc-section'><h3>Timeline: {topic}</h3><p>",
+        "<div class='doc-section'><h3>Historical Context</h3><p>",
+        "<div class='doc-section'><h3>Chronological Overview</h3><p>"
+    ),
+    "reason": (
+        "<div class='doc-section'><h3>Analysis: Why {topic}?</h3><p>",
+        "<div class='doc-section'><h3>Key Factors</h3><p>",
+        "<div class='doc-section'><h3>Root Causes</h3><p>"
+    ),
+    "process": (
+        "<div class='doc-section'><h3>Process: {topic}</h3><p>",
+        "<div class='doc-section'><h3>Workflow Overview</h3><p>",
+        "<div class='doc-section'><h3>Step-by-Step Guide</h3><p>"
+    ),
+    "comparison": (
+        "<div class='doc-section'><h3>Comparison: {topic}</h3><p>",
+        "<div class='doc-section'><h3>Key Differences</h3><p>",
+        "<div class='doc-section'><h3>Comparative Analysis</h3><p>"
+    ),
+    "recommendation": (
+        "<div class='doc-section'><h3>Recommendations: {topic}</h3><p>",
+        "<div class='doc-section'><h3>Best Practices</h3><p>",
+        "<div class='doc-section'><h3>Expert Suggestions</h3><p>"
+    ),
+    "ranking": (
+        "<div class='doc-section'><h3>Rankings: {topic}</h3><p>",
+        "<div class='doc-section'><h3>Top Results</h3><p>",
+        "<div class='doc-section'><h3>Ranked List</h3><p>"
+    ),
+    "informational": (
+        "<div class='doc-section'><h3>Information: {topic}</h3><p>",
+        "<div class='doc-section'><h3>Overview</h3><p>",
+        "<div class='doc-section'><h3>Key Facts</h3><p>"
+    )
+}
+
+# Ranking answers rendered from templates compiled once; scraped text is HTML-escaped
+_TEMPLATES = Environment(autoescape=True, trim_blocks=True, lstrip_blocks=True, keep_trailing_newline=True)
+
+_RANKING_TEMPLATE = _TEMPLATES.from_string("""\
+<div class='doc-section'>
+<h3>{{ title }}</h3>
+<ol class='ranked-list'>
+{% for item in items %}
+<li><strong>{{ item }}</strong></li>
+{% endfor %}
+</ol>
+</div>
+<div class='doc-section'>
+<h3>Context</h3>
+<p>{{ context }}...</p>
+</div>
+""")
+
+_CITY_ANSWER_TEMPLATE = _TEMPLATES.from_string("""\
+{% if top_city %}
+<div class='doc-section'>
+<h3>Answer</h3>
+<p class='direct-answer'><strong>{{ top_city }}</strong> is the cleanest city.</p>
+</div>
+{% endif %}
+{% if cities %}
+<div class='doc-section'>
+<h3>Top 10 Cleanest Cities</h3>
+<ol class='ranked-list'>
+{% for city in cities %}
+<li><strong>{{ city }}</strong>{% if city == top_city %} (Winner){% endif %}</li>
+{% endfor %}
+</ol>
+</div>
+{% endif %}
+{% if top_city %}
+<div class='doc-section'>
+<h3>{{ top_city }}'s Cleanliness Initiatives</h3>
+{% if city_sentences %}
+<ul class='initiative-list'>
+{% for sentence in city_sentences %}
+<li>{{ sentence }}</li>
+{% endfor %}
+</ul>
+{% else %}
+<p>{{ context }}...</p>
+{% endif %}
+</div>
+{% endif %}
+{% if ranking_info %}
+<div class='doc-section'>
+<h3>Ranking Methodology</h3>
+<p>{{ ranking_info }}</p>
+</div>
+{% endif %}
+""")
+
+# Recent summaries keyed by (query, max_length, text digest), least recently used first
+_summary_cache = OrderedDict()
+_summary_cache_lock = threading.Lock()
+SUMMARY_CACHE_SIZE = 1000
+
+# Abbreviations whose trailing period doesn't end a sentence (case-sensitive, so a sentence
+# ending in a lowercase word like "no." or "st." still splits)
+_ABBREVIATIONS = frozenset({'Mr', 'Mrs', 'Ms', 'Dr', 'Prof', 'St', 'Jr', 'Sr', 'Inc', 'Ltd', 'Co', 'Corp',
+                            'vs', 'e.g', 'E.g', 'i.e', 'I.e', 'U.S'})
 
 
 def summarize(query, text, max_length=2048):
@@ -39,87 +228,86 @@ def summarize(query, text, max_length=2048):
         if not text or len(text) < 100:
             return f"I couldn't find much information about '{query}'. Please try a different query."
 
-        # Clean up the input text - remove redundant spaces, fix broken sentences
-        text = re.sub(r'\s+', ' ', text).strip()
-        text = re.sub(r'\.([A-Z])', r'. \1', text)  # Fix merged sentences
+        # Identical query + search text always yields the same summary
+        cache_key = (query, max_length, xxhash.xxh3_128_digest(text))
+        with _summary_cache_lock:
+            cached = _summary_cache.get(cache_key)
+            if cached is not None:
+                _summary_cache.move_to_end(cache_key)
+        if cached is not None:
+            logger.debug("Using cached summary")
+            return cached
 
-        # Remove source URLs and citation patterns commonly found in scraped text
-        text = re.sub(r'From https?://[^\s]+:\s*', '', text)
-        text = re.sub(r'\[citation needed\]|\[\d+\]', '', text)
+        # Clean up the input text - remove redundant spaces, fix broken sentences
+        text = ' '.join(text.split())
+        text = _MERGED_SENTENCE_RE.sub(r'. \1', text)  # Fix merged sentences
 
-        # Remove redundant newlines that often appear in scraped content
-        text = re.sub(r'\n+', '\n', text)
+        # Remove source URLs and citation patterns commonly found in scraped text (one pass)
+        text = _SCRAPE_NOISE_RE.sub('', text)
 
         # Split into sections by newlines (often paragraphs in web content)
         sections = text.split('\n')
 
-        # Join very short sections with the next one
+        # Join very short sections with the next one, collecting the pieces of the
+        # current buffer in a list and tracking its joined length
         merged_sections = []
-        buffer = ""
+        buffer_parts = []
+        buffer_len = 0
         for section in sections:
-            if len(buffer) < 100 and buffer:
-                buffer += " " + section
+            if 0 < buffer_len < 100:
+                buffer_parts.append(section)
+                buffer_len += 1 + len(section)
             else:
-                if buffer:
-                    merged_sections.append(buffer)
-                buffer = section
-        if buffer:
-            merged_sections.append(buffer)
-
-        # Split into sentences using NLTK (more accurate for natural language)
-        try:
-            all_sentences = []
-            for section in merged_sections:
-                all_sentences.extend(sent_tokenize(section))
-        except:
-            # Fall back to simple splitting if NLTK fails
-            all_sentences = []
-            for section in merged_sections:
-                all_sentences.extend([s.strip() for s in re.split(r'[.!?]+', section) if s.strip()])
+                if buffer_len:
+                    merged_sections.append(" ".join(buffer_parts))
+                buffer_parts = [section]
+                buffer_len = len(section)
+        if buffer_len:
+            merged_sections.append(" ".join(buffer_parts))
+
+        # Split into sentences
+        all_sentences = []
+        for section in merged_sections:
+            all_sentences.extend(split_sentences(section))
 
         # Filter out very short sentences (often not meaningful)
         sentences = [s for s in all_sentences if len(s.split()) > 3]
 
         # Extract keywords from the query
-        query_words = set(word.lower() for word in re.findall(r'\w+', query))
-
-        # Calculate sentence scores based on multiple factors
-        sentence_scores = {}
-        for i, sentence in enumerate(sentences):
-            words = set(word.lower() for word in re.findall(r'\w+', sentence))
-
-            # Core scoring factors
-            relevance_score = len(words.intersection(query_words)) / max(1, len(query_words))
-            position_score = 1.0 / (i / 10 + 1)  # Less steep decay in importance
-            length_score = min(1.0, len(sentence) / 150)  # Prefer medium-length sentences
-
-            # Informational sentence indicators
-            has_numbers = 1.5 if any(c.isdigit() for c in sentence) else 1.0  # Boost sentences with facts/numbers
-            has_entities = 1.3 if re.search(r'[A-Z][a-z]+(?:\s+[A-Z][a-z]+)+',
-                                            sentence) else 1.0  # Boost named entities
-
-            # Combine scores with weights
-            sentence_scores[i] = (
-                                         (0.5 * relevance_score) +
-                                         (0.2 * position_score) +
-                                         (0.1 * length_score)
-                                 ) * has_numbers * has_entities
+        query_words = set(word.lower() for word in _WORD_RE.findall(query))
+
+        # Calculate sentence scores based on multiple factors, indexed by sentence position.
+        # Each sentence is lowercased and tokenized at most once.
+        query_size = max(1, len(query_words))
+        sentence_scores = [
+            (
+                    (0.5 * (sentence_overlap(sentence.lower(), query_words) / query_size)) +
+                    (0.2 * (1.0 / (i / 10 + 1))) +  # Position: less steep decay in importance
+                    (0.1 * min(1.0, len(sentence) / 150))  # Prefer medium-length sentences
+            )
+            * (1.5 if _DIGIT_RE.search(sentence) else 1.0)  # Boost sentences with facts/numbers
+            * (1.3 if _ENTITY_RE.search(sentence) else 1.0)  # Boost named entities
+            for i, sentence in enumerate(sentences)
+        ]
 
         # Select top sentences (with a minimum of important ones, but don't make it too long)
         num_sentences = max(5, min(20, int(len(sentences) * 0.25)))
-        top_sentences = sorted(sentence_scores.keys(), key=lambda i: sentence_scores[i], reverse=True)[:num_sentences]
+        top_sentences = heapq.nlargest(num_sentences, range(len(sentences)), key=sentence_scores.__getitem__)
 
         # Maintain original order of sentences
         selected_indices = sorted(top_sentences)
 
         # Ensure we don't have just scattered sentences - try to include context
+        # (randomness is seeded from the text so cached and fresh summaries agree)
+        rng = random.Random(cache_key[2])
+        include_next = [rng.random() < 0.3 for _ in selected_indices]
         context_indices = set(selected_indices)
-        for idx in selected_indices:
+        for idx, with_next in zip(selected_indices, include_next):
             # Include the sentence before selected sentence if it exists
             if idx > 0 and idx - 1 not in context_indices:
                 context_indices.add(idx - 1)
             # And sometimes the one after it
-            if idx < len(sentences) - 1 and random.random() < 0.3 and idx + 1 not in context_indices:
+            if with_next and idx < len(sentences) - 1 and idx + 1 not in context_indices:
                 context_indices.add(idx + 1)
 
         # Recreate in order with context
@@ -129,8 +317,9 @@ def summarize(query, text, max_length=2048):
         summary_parts = [sentences[i] for i in final_indices[:30]]  # Limit to prevent excessive length
         summary = " ".join(summary_parts)
 
-        # Truncate if still too long
+        # Truncate if still too long (the truncated summary no longer matches its parts)
         if len(summary) > max_length:
+            summary_parts = None
             # Try to truncate at a sentence boundary
             last_period = summary[:max_length - 3].rfind('.')
             if last_period > max_length / 2:  # If we can find a good breaking point
@@ -139,7 +328,12 @@ def summarize(query, text, max_length=2048):
                 summary = summary[:max_length - 3] + "..."
 
         # Format the response as an answer to the query
-        response = format_answer(query, summary)
+        response = format_answer(query, summary, summary_parts)
+
+        with _summary_cache_lock:
+            _summary_cache[cache_key] = response
+            if len(_summary_cache) > SUMMARY_CACHE_SIZE:
+                _summary_cache.popitem(last=False)
 
         return response
 
@@ -148,210 +342,164 @@ def summarize(query, text, max_length=2048):
         return f"I encountered an error while processing your query. Please try again with a more specific question."
 
 
-def format_answer(query, summary):
-    """Format the summary as an answer to the query with professional HTML formatting and structure."""
+def sentence_overlap(sentence_lower, query_words):
+    """Count the query words that appear as words in a lowercased sentence."""
+    # For short queries a substring check rules out most sentences without tokenizing them
+    if len(query_words) <= 5 and not any(word in sentence_lower for word in query_words):
+        return 0
+    return len(query_words.intersection(_WORD_RE.findall(sentence_lower)))
+
+
+def split_sentences(text):
+    """Split text into sentences at .!? followed by a capitalized word, keeping abbreviations intact."""
+    sentences = []
+    for part in _SENTENCE_BOUNDARY_RE.split(text):
+        previous = sentences[-1] if sentences else ''
+        if previous.endswith('.') and previous.rsplit(None, 1)[-1][:-1] in _ABBREVIATIONS:
+            sentences[-1] = previous + ' ' + part
+        else:
+            sentences.append(part)
+    return sentences
+
+
+def format_answer(query, summary, sentences=None):
+    """
+    Format the summary as an answer to the query with professional HTML formatting and structure.
+
+    Args:
+        query (str): The user's question
+        summary (str): The summarized text
+        sentences (list): The sentences the summary was joined from, if known
+    """
     # Clean up the summary
     response = summary.strip()
 
     # If summary is too short, return it with a simple intro
     if len(response) < 100:
-        return f"<div class='doc-section'><h3>Quick Answer</h3><p><strong>Based on my search:</strong> {response}</p></div>"
+        return f"<div class='doc-section'><h3>Quick Answer</h3><p><strong>Based on my search:</strong> {escape(response)}</p></div>"
 
     # Extract the query topic
     query = query.rstrip('?')
     query_topic = query.lower()
-    query_words = set(re.findall(r'\b\w+\b', query_topic))
+    query_words = set(_WORD_RE.findall(query_topic))
 
     # Remove common question words from the topic
-    question_words = {'what', 'who', 'where', 'when', 'why', 'how', 'is', 'are', 'was', 'were', 'do', 'does', 'did',
-                      'can', 'could', 'would', 'should', 'has', 'have', 'had'}
-    topic_words = [w for w in query_words if w not in question_words and len(w) > 2]
+    topic_words = [w for w in query_words if w not in _QUESTION_WORDS and len(w) > 2]
     topic_phrase = ' '.join(topic_words[:3]) if topic_words else query_topic
 
     # Identify query type from query text
     question_type = identify_query_type(query)
 
+    ranking = is_ranking_query(query)
+
+    # Try to extract ranked items, lists, or other structured content; every
+    # output path below uses the list, so extract it once up front
+    extracted_list = extract_list_items(summary)
+
     # Check for special cases that require more structured output
-    if is_ranking_query(query):
+    if ranking:
         # Attempt to create a ranking-style answer with better structure
-        structured_answer = create_ranking_answer(query, summary)
+        structured_answer = create_ranking_answer(query, summary, extracted_list)
         if structured_answer:
             return structured_answer
 
+    direct_answer = extract_direct_answer(query, summary)
+
     # Check for city/location queries
-    if "city" in query.lower() or "cities" in query.lower() or "cleanest" in query.lower():
-        city_answer = create_city_ranking_answer(query, summary)
+    if "city" in query_topic or "cities" in query_topic or "cleanest" in query_topic:
+        city_answer = create_city_ranking_answer(query, summary, extracted_list, direct_answer, sentences)
         if city_answer:
             return city_answer
 
-    # Create a professional documentation-style introduction based on question type
-    intros = {
-        "person": [
-            f"<div class='doc-section'><h3>About {topic_phrase.title()}</h3><p>",
-            f"<div class='doc-section'><h3>Profile Information</h3><p><strong>Overview: </strong>",
-            f"<div class='doc-section'><h3>Research Results</h3><p>"
-        ],
-        "location": [
-            f"<div class='doc-section'><h3>Location Information: {topic_phrase.title()}</h3><p>",
-            f"<div class='doc-section'><h3>Geographical Data</h3><p><strong>Location: </strong>",
-            f"<div class='doc-section'><h3>Location Analysis</h3><p>"
-        ],
-        "time": [
-            f"<div class='doc-section'><h3>Timeline: {topic_phrase.title()}</h3><p>",
-            f"<div class='doc-section'><h3>Historical Context</h3><p>",
-            f"<div class='doc-section'><h3>Chronological Overview</h3><p>"
-        ],
-        "reason": [
-            f"<div class='doc-section'><h3>Analysis: Why {topic_phrase.title()}?</h3><p>",
-            f"<div class='doc-section'><h3>Key Factors</h3><p>",
-            f"<div class='doc-section'><h3>Root Causes</h3><p>"
-        ],
-        "process": [
-            f"<div class='doc-section'><h3>Process: {topic_phrase.title()}</h3><p>",
-            f"<div class='doc-section'><h3>Workflow Overview</h3><p>",
-            f"<div class='doc-section'><h3>Step-by-Step Guide</h3><p>"
-        ],
-        "comparison": [
-            f"<div class='doc-section'><h3>Comparison: {topic_phrase.title()}</h3><p>",
-            f"<div class='doc-section'><h3>Key Differences</h3><p>",
-            f"<div class='doc-section'><h3>Comparative Analysis</h3><p>"
-        ],
-        "recommendation": [
-            f"<div class='doc-section'><h3>Recommendations: {topic_phrase.title()}</h3><p>",
-            f"<div class='doc-section'><h3>Best Practices</h3><p>",
-            f"<div class='doc-section'><h3>Expert Suggestions</h3><p>"
-        ],
-        "ranking": [
-            f"<div class='doc-section'><h3>Rankings: {topic_phrase.title()}</h3><p>",
-            f"<div class='doc-section'><h3>Top Results</h3><p>",
-            f"<div class='doc-section'><h3>Ranked List</h3><p>"
-        ],
-        "informational": [
-            f"<div class='doc-section'><h3>Information: {topic_phrase.title()}</h3><p>",
-            f"<div class='doc-section'><h3>Overview</h3><p>",
-            f"<div class='doc-section'><h3>Key Facts</h3><p>"
-        ]
-    }
-
-    # Select a random intro from the appropriate category
-    selected_intro = random.choice(intros.get(question_type, intros["informational"]))
+    # Create a professional documentation-style introduction based on question type,
+    # picking a random intro from the appropriate category
+    selected_intro = random.choice(_INTROS.get(question_type, _INTROS["informational"])).format(
+        topic=escape(topic_phrase.title()))
 
-    # Try to extract ranked items, lists, or other structured content
-    extracted_list = extract_list_items(summary)
-    direct_answer = extract_direct_answer(query, summary)
+    # A short informational answer with nothing to list or highlight reads best as
+    # plain text, so skip the bullet and fact scans entirely
+    if question_type == "informational" and len(response) < 300 and not direct_answer and len(extracted_list) < 3:
+        return selected_intro + escape(response) + "</p></div>\n"
 
-    # Pre-process the response text for better formatting
+    # The bullet and fact scans only pay off on longer summaries
+    long_summary = len(response) > 500
 
-    # Identify potential key points for bullet lists (starting with common markers)
+    # Identify potential key points for bullet lists (starting with common markers),
+    # finding all list-like patterns in one scan of the text
     potential_bullets = []
-
-    # Try to find list-like patterns in the text
-    bullet_patterns = [
-        r'(?:^|\n)(?:\d+\.\s+|\*\s+|:\s+)([A-Z][^.!?]*[.!?])',  # Numbered/bullet points
-        r'(?:^|\n)(?:First|Second|Third|Finally|Lastly)[,:]?\s+([A-Z][^.!?]*[.!?])',  # Sequence markers
-        r'(?<=[.!?])\s+([A-Z][^.!?]*? (?:include|includes|are|is|was|were):[^.!?]*[.!?])'  # Definition patterns
-    ]
-
-    for pattern in bullet_patterns:
-        bullet_matches = re.findall(pattern, response)
-        if bullet_matches:
-            potential_bullets.extend(bullet_matches)
+    if long_summary:
+        potential_bullets = [match.group(match.lastindex) for match in _BULLET_RE.finditer(response)]
 
     # If we don't have enough bullet points but we have extracted list, use those
     if (not potential_bullets or len(potential_bullets) < 3) and extracted_list:
         potential_bullets = extracted_list
 
     # Find key sentences that have important facts or definitions
-    fact_patterns = [
-        r'([^.!?]*? is [^.!?]*?\.)',  # Definition patterns
-        r'([^.!?]*? are [^.!?]*?\.)',
-        r'([^.!?]*? was [^.!?]*?\.)',
-        r'([^.!?]*? were [^.!?]*?\.)',
-        r'([^.!?]*? has [^.!?]*?\.)',
-        r'([^.!?]*? have [^.!?]*?\.)',
-        r'([^.!?]*? contains [^.!?]*?\.)',
-        r'([^.!?]*? includes [^.!?]*?\.)',
-        r'([^.!?]*? consists of [^.!?]*?\.)',
-    ]
-
-    key_facts = []
-    for pattern in fact_patterns:
-        fact_matches = re.findall(pattern, response)
-        if fact_matches:
-            key_facts.extend(fact_matches[:2])  # Limit to avoid over-highlighting
+    facts_by_verb = {}
+    for fact, verb in _FACT_RE.findall(response) if long_summary else ():
+        facts = facts_by_verb.setdefault(verb, [])
+        if len(facts) < 2:  # Limit to avoid over-highlighting
+            facts.append(fact)
+    key_facts = [fact for verb in _FACT_VERBS for fact in facts_by_verb.get(verb, ())]
+
+    # Build the HTML as a list of pieces and join once at the end. Every piece of text
+    # taken from the summary (scraped pages) is HTML-escaped, as in the Jinja templates.
+    html = []
+    direct_answer_html = escape(direct_answer) if direct_answer else ""
 
     # IMPORTANT: Start with a direct answer if we have one
-    formatted_response = ""
     if direct_answer:
-        formatted_response = f"""
+        html.append(f"""
         <div class='doc-section'>
             <h3>Direct Answer</h3>
-            <p class='direct-answer'><strong>{direct_answer}</strong></p>
+            <p class='direct-answer'><strong>{direct_answer_html}</strong></p>
         </div>
-        """
+        """)
 
     # Now begin building the main content with sections
-    formatted_response += selected_intro
+    html.append(selected_intro)
 
     # If we found potential bullet points, format them with professional styling
     if potential_bullets and len(potential_bullets) >= 3:
-        # Create a professional bullet list section if we found enough points
-        bullet_html = "</p></div>\n<div class='doc-section'>\n"
+        # Add the start of the text, then a professional bullet list section
+        html.append(escape(response[:150]))
+        html.append("...</p></div>\n</p></div>\n<div class='doc-section'>\n")
 
         # Choose appropriate title based on query type
-        if question_type == "ranking" or is_ranking_query(query):
-            bullet_html += "<h3>Top Results</h3>\n"
-        elif "cleanest city" in query.lower() or "best city" in query.lower():
-            bullet_html += "<h3>Top Cleanest Cities</h3>\n"
+        if question_type == "ranking" or ranking:
+            html.append("<h3>Top Results</h3>\n")
+        elif "cleanest city" in query_topic or "best city" in query_topic:
+            html.append("<h3>Top Cleanest Cities</h3>\n")
         else:
-            bullet_html += "<h3>Key Points</h3>\n"
+            html.append("<h3>Key Points</h3>\n")
 
         # Create a numbered or unordered list based on query type
-        if question_type == "ranking" or is_ranking_query(query) or "top" in query.lower() or "best" in query.lower():
-            bullet_html += "<ol class='key-points'>\n"
-        else:
-            bullet_html += "<ul class='key-points'>\n"
+        numbered = question_type == "ranking" or ranking or "top" in query_topic or "best" in query_topic
+        html.append("<ol class='key-points'>\n" if numbered else "<ul class='key-points'>\n")
 
         for bullet in potential_bullets[:8]:  # Limit to prevent excessive lists
-            # Enhance bullet points with better formatting
-            bullet_text = bullet.strip()
-
-            # Look for potential highlightable terms in bullet points
-            highlight_terms = re.findall(r'\b([A-Z][a-z]+(?:[A-Z][a-z]+)*)\b', bullet_text)
+            # Enhance bullet points with better formatting, highlighting important
+            # terms in a single pass over the bullet
+            bullet_text = highlight_terms(escape(bullet.strip()))
 
-            # Highlight important terms if found
-            if highlight_terms:
-                for term in highlight_terms:
-                    # Don't highlight common words or short terms
-                    if len(term) > 3 and term.lower() not in ['this', 'that', 'these', 'those', 'there', 'their',
-                                                              'which', 'where', 'when', 'what']:
-                        bullet_text = bullet_text.replace(term, f"<em>{term}</em>", 1)
-
-            bullet_html += f"<li>{bullet_text}</li>\n"
+            html.append(f"<li>{bullet_text}</li>\n")
 
         # Close the list
-        if question_type == "ranking" or is_ranking_query(query) or "top" in query.lower() or "best" in query.lower():
-            bullet_html += "</ol>\n</div>\n"
-        else:
-            bullet_html += "</ul>\n</div>\n"
-
-        # Add the bullet list after the introduction
-        formatted_response += response[:150] + "...</p></div>\n" + bullet_html
+        html.append("</ol>\n</div>\n" if numbered else "</ul>\n</div>\n")
     else:
         # If we don't have bullets, just use the regular content
-        formatted_response += response + "</p></div>\n"
+        html.append(escape(response))
+        html.append("</p></div>\n")
 
     # Create a separate "Key Facts" section if we found substantial facts
     important_facts = [fact for fact in key_facts if len(fact) > 20]
 
     if len(important_facts) >= 2:
-        facts_html = "<div class='doc-section'>\n"
-        facts_html += "<h3>Important Facts</h3>\n"
-        facts_html += "<ul class='fact-list'>\n"
+        html.append("<div class='doc-section'>\n<h3>Important Facts</h3>\n<ul class='fact-list'>\n")
 
         for fact in important_facts[:4]:  # Limit to top 4 facts
             # Clean up the fact text and emphasize key parts
-            fact_text = fact.strip()
+            fact_text = escape(fact.strip())
 
             # Look for specific patterns to emphasize
             if " is " in fact_text:
@@ -365,277 +513,81 @@ def format_answer(query, summary):
                 predicate = parts[1].strip()
                 fact_text = f"<strong>{subject}</strong> are {predicate}"
 
-            facts_html += f"<li>{fact_text}</li>\n"
+            html.append(f"<li>{fact_text}</li>\n")
 
-        facts_html += "</ul>\n</div>\n"
-
-        # Add the facts section 
-        formatted_response += facts_html
+        html.append("</ul>\n</div>\n")
 
     # If this is about a specific city or topic, add a details section
     if direct_answer and len(direct_answer) > 0:
-        details_html = "<div class='doc-section'>\n"
-        details_html += f"<h3>Details: {direct_answer}</h3>\n"
+        html.append(f"<div class='doc-section'>\n<h3>Details: {direct_answer_html}</h3>\n")
 
-        # Extract sentences about the direct answer
-        related_sentences = []
-        for sentence in re.split(r'(?<=[.!?])\s+', summary):
-            if direct_answer in sentence and len(sentence) > 30:
-                related_sentences.append(sentence.strip())
+        # Extract sentences about the direct answer (limit to 3 details)
+        related_sentences = sentences_mentioning(direct_answer, summary, sentences, 3)
 
         if related_sentences:
-            details_html += "<ul class='details-list'>\n"
-            for sentence in related_sentences[:3]:  # Limit to 3 details
-                details_html += f"<li>{sentence}</li>\n"
-            details_html += "</ul>\n"
+            html.append("<ul class='details-list'>\n")
+            for sentence in related_sentences:
+                html.append(f"<li>{escape(sentence)}</li>\n")
+            html.append("</ul>\n")
         else:
-            details_html += f"<p>Additional information about {direct_answer} is not available in the current search results.</p>\n"
-
-        details_html += "</div>\n"
-
-        # Add the details section
-        formatted_response += details_html
-
-    return formatted_response
-
-
-def extract_list_items(text):
-    """Extract list items from text based on patterns."""
-    items = []
-
-    # Method 1: Look for numbered items like "1. Item" or "1) Item"
-    numbered = re.findall(r'(?:^|\n|\. )([1-9][0-9]?)[\.|\)]\s+([A-Z][^.!?]+)', text)
-    if numbered:
-        # Convert to a dictionary to handle possible duplicates
-        numbered_dict = {}
-        for num_str, item_text in numbered:
-            try:
-                num = int(num_str)
-                if 1 <= num <= 20:  # Reasonable list size
-                    numbered_dict[num] = item_text.strip()
-            except ValueError:
-                continue
-
-        # Convert back to ordered list if we have enough items
-        if len(numbered_dict) >= 3:
-            # Sort by the numbers
-            items = [item for _, item in sorted(numbered_dict.items())]
-
-    # Method 2: Look for bullet points
-    if not items:
-        bullets = re.findall(r'(?:^|\n)[\*\-•]\s+([A-Z][^.!?]+)', text)
-        if len(bullets) >= 3:
-            items = [item.strip() for item in bullets]
-
-    # Method 3: Look for city names followed by descriptions
-    if not items:
-        cities = re.findall(
-            r'([A-Z][a-z]+(?:\s+[A-Z][a-z]+){0,2})\s+(?:is|was|has been)\s+(?:ranked|rated|known|named|called|considered|recognized)',
-            text)
-        if len(cities) >= 3:
-            items = [city.strip() for city in cities]
-
-    return items
-
-
-def extract_direct_answer(query, text):
-    """Extract the direct answer to a question from text."""
-    query = query.lower().strip()
-
-    # For "cleanest city" type questions
-    if "cleanest city" in query or "cleanest cities" in query:
-        # Try different patterns for finding the cleanest city
-        patterns = [
-            r'([A-Z][a-z]+(?:\s+[A-Z][a-z]+)?)\s+(?:is|has been|was|remains)\s+(?:the|recognized as the|consistently|rated as the)\s+cleanest\s+city',
-            r'the\s+cleanest\s+city\s+(?:in|of)\s+[A-Z][a-z]+\s+is\s+([A-Z][a-z]+(?:\s+[A-Z][a-z]+)?)',
-            r'([A-Z][a-z]+(?:\s+[A-Z][a-z]+)?)\s+tops\s+the\s+list\s+of\s+cleanest\s+cities',
-            r'([A-Z][a-z]+(?:\s+[A-Z][a-z]+)?)\s+was\s+awarded\s+the\s+title\s+of\s+cleanest\s+city'
-        ]
-
-        for pattern in patterns:
-            match = re.search(pattern, text, re.IGNORECASE)
-            if match:
-                return match.group(1)
-
-        # If no direct match, try to find the first city in a list context
-        list_pattern = r'(?:1|1st|one|first)[\.\)]\s+([A-Z][a-z]+(?:\s+[A-Z][a-z]+)?)'
-        list_match = re.search(list_pattern, text)
-        if list_match:
-            return list_match.group(1)
-
-    # For capital city questions
-    elif "capital" in query and ("city" in query or "what is" in query):
-        country_match = re.search(r'capital of ([A-Za-z]+)', query)
-        if country_match:
-            country = country_match.group(1)
-            capital_pattern = rf'(?:capital|capital city) of {country} is ([A-Z][a-z]+(?:\s+[A-Z][a-z]+)?)'
-            capital_match = re.search(capital_pattern, text, re.IGNORECASE)
-            if capital_match:
-                return capital_match.group(1)
-
-    # For "what is" or definition queries
-    elif query.startswith("what is"):
-        topic = query.replace("what is", "").replace("?", "").strip()
-        if topic:
-            definition_pattern = rf'{topic} (?:is|refers to|means) ([^.!?]+)'
-            definition_match = re.search(definition_pattern, text, re.IGNORECASE)
-            if definition_match:
-                return definition_match.group(1).strip()
-
-    # For questions about tallest, shortest, biggest, etc.
-    elif any(word in query for word in ["tallest", "highest", "biggest", "largest", "smallest", "shortest"]):
-        for word in ["tallest", "highest", "biggest", "largest", "smallest", "shortest"]:
-            if word in query:
-                pattern = rf'(?:the|world\'s|earth\'s) {word} ([^.!?]+) is ([A-Z][a-z]+(?:\s+[A-Z][a-z]+)?)'
-                match = re.search(pattern, text, re.IGNORECASE)
-                if match:
-                    return f"{match.group(2)} ({match.group(1)})"
-
-    # No direct answer found
-    return None
+            html.append(f"<p>Additional information about {direct_answer_html} is not available in the current search results.</p>\n")
 
+        html.append("</div>\n")
 
-def create_ranking_answer(query, summary):
-    """Create a structured ranking answer for list-type queries."""
-    # Extract list items from the summary
-    items = extract_list_items(summary)
+    return "".join(html)
 
-    # If we couldn't extract a proper list, return None
-    if not items or len(items) < 3:
-        return None
 
-    # Format a structured answer
-    result = "<div class='doc-section'>\n"
+def sentences_mentioning(term, summary, sentences, limit):
+    """Return up to `limit` substantial sentences mentioning a term, splitting the summary only if needed."""
+    if sentences is None:
+        sentences = iter_sentences(summary)
 
-    # Create a header based on the query
-    if "cleanest city" in query.lower() or "cleanest cities" in query.lower():
-        result += "<h3>Top Cleanest Cities</h3>\n"
-    elif "top" in query.lower():
-        result += "<h3>Top Results</h3>\n"
-    elif "best" in query.lower():
-        result += "<h3>Best Results</h3>\n"
-    else:
-        result += "<h3>Ranked List</h3>\n"
+    found = []
+    for sentence in sentences:
+        if term in sentence and len(sentence) > 30:
+            found.append(sentence.strip())
+            if len(found) == limit:
+                break
+    return found
 
-    # Create a numbered list
-    result += "<ol class='ranked-list'>\n"
-    for item in items[:10]:  # Limit to top 10
-        result += f"<li><strong>{item}</strong></li>\n"
-    result += "</ol>\n</div>\n"
 
-    # Add a brief explanation section
-    result += "<div class='doc-section'>\n"
-    result += "<h3>Context</h3>\n"
-    result += f"<p>{summary[:300]}...</p>\n"
-    result += "</div>\n"
+def iter_sentences(text):
+    """Lazily yield the pieces of _SENTENCE_SPLIT_RE.split(text), so callers can stop early."""
+    start = 0
+    for match in _SENTENCE_SPLIT_RE.finditer(text):
+        yield text[start:match.start()]
+        start = match.end()
+    yield text[start:]
 
-    return result
 
+def highlight_terms(text):
+    """Emphasize the first occurrence of each capitalized term, skipping short and common words."""
+    seen = set()
 
-def create_city_ranking_answer(query, summary):
-    """Create a specialized answer for city ranking queries."""
-    # Try to extract the direct answer (top city)
-    top_city = extract_direct_answer(query, summary)
+    def emphasize(match):
+        term = match.group(0)
+        if len(term) > 3 and term not in seen and term.lower() not in _HIGHLIGHT_STOP_WORDS:
+            seen.add(term)
+            return f"<em>{term}</em>"
+        return term
 
-    # Try to extract a list of cities
-    city_list = extract_list_items(summary)
-
-    # If we don't have the necessary information, return None
-    if not (top_city or (city_list and len(city_list) >= 3)):
-        return None
-
-    # Start building the response
-    result = ""
-
-    # Add the direct answer section if we found one
-    if top_city:
-        result += f"""
-        <div class='doc-section'>
-            <h3>Answer</h3>
-            <p class='direct-answer'><strong>{top_city}</strong> is the cleanest city.</p>
-        </div>
-        """
-
-    # Add the ranking list if available
-    if city_list and len(city_list) >= 3:
-        result += "<div class='doc-section'>\n"
-        result += "<h3>Top 10 Cleanest Cities</h3>\n"
-        result += "<ol class='ranked-list'>\n"
-
-        for i, city in enumerate(city_list[:10]):  # Limit to top 10
-            # Highlight the top city if it matches our direct answer
-            if top_city and city == top_city:
-                result += f"<li><strong>{city}</strong> (Winner)</li>\n"
-            else:
-                result += f"<li><strong>{city}</strong></li>\n"
-
-        result += "</ol>\n</div>\n"
-
-    # If we have a top city, add a details section
-    if top_city:
-        result += "<div class='doc-section'>\n"
-        result += f"<h3>{top_city}'s Cleanliness Initiatives</h3>\n"
-
-        # Extract sentences about the top city
-        city_sentences = []
-        for sentence in re.split(r'(?<=[.!?])\s+', summary):
-            if top_city in sentence and len(sentence) > 30:
-                city_sentences.append(sentence.strip())
-
-        if city_sentences:
-            result += "<ul class='initiative-list'>\n"
-            for sentence in city_sentences[:4]:  # Limit to 4 points
-                result += f"<li>{sentence}</li>\n"
-            result += "</ul>\n"
-        else:
-            # If we can't find specific sentences, add a general paragraph
-            result += f"<p>{summary[:250]}...</p>\n"
-
-        result += "</div>\n"
-
-    # Add a brief explanation of the ranking system if available
-    ranking_info = re.search(r'(?:[Tt]hese rankings|[Tt]he rankings|[Tt]he assessment|[Tt]he survey) [^.!?]+[.!?]',
-                             summary)
-    if ranking_info:
-        result += "<div class='doc-section'>\n"
-        result += "<h3>Ranking Methodology</h3>\n"
-        result += f"<p>{ranking_info.group(0)}</p>\n"
-        result += "</div>\n"
-
-    return result
+    return _HIGHLIGHT_TERM_RE.sub(emphasize, text)
 
 
 def identify_query_type(query):
     """Identify the type of query for better formatting."""
     query = query.lower()
 
-    if any(x in query for x in ["who", "person", "people", "name"]):
-        return "person"
-    elif any(x in query for x in ["where", "location", "place", "country", "city"]):
-        return "location"
-    elif any(x in query for x in ["when", "date", "time", "year"]):
-        return "time"
-    elif any(x in query for x in ["how many", "count", "number", "total"]):
-        return "quantity"
-    elif any(x in query for x in ["what is", "meaning", "define", "definition"]):
-        return "definition"
-    elif any(x in query for x in ["list", "top", "best", "ranked", "rating", "cleanest"]):
-        return "ranking"
-    elif any(x in query for x in ["why", "reason", "cause", "because"]):
-        return "reason"
-    elif any(x in query for x in ["how", "process", "steps", "way", "method", "procedure"]):
-        return "process"
-    elif any(x in query for x in ["difference", "compare", "versus", "vs"]):
-        return "comparison"
-    else:
-        return "informational"
+    for query_type, pattern in _QUERY_TYPE_PATTERNS:
+        if pattern.search(query):
+            return query_type
+
+    return "informational"
 
 
 def is_ranking_query(query):
     """Check if this is a ranking-type query."""
-    query = query.lower()
-    return any(x in query for x in
-               ["top", "best", "cleanest", "greatest", "largest", "smallest", "highest", "lowest", "rank", "list"])
+    return bool(_RANKING_RE.search(query.lower()))
 
 
 def extract_list_items(text):
@@ -643,7 +595,7 @@ def extract_list_items(text):
     items = []
 
     # Method 1: Look for numbered items like "1. Item" or "1) Item"
-    numbered = re.findall(r'(?:^|\n|\. )([1-9][0-9]?)[\.|\)]\s+([A-Z][^.!?]+)', text)
+    numbered = _NUMBERED_ITEM_RE.findall(text)
     if numbered:
         # Convert to a dictionary to handle possible duplicates
         numbered_dict = {}
@@ -662,15 +614,13 @@ def extract_list_items(text):
 
     # Method 2: Look for bullet points
     if not items:
-        bullets = re.findall(r'(?:^|\n)[\*\-•]\s+([A-Z][^.!?]+)', text)
+        bullets = _BULLET_ITEM_RE.findall(text)
         if len(bullets) >= 3:
             items = [item.strip() for item in bullets]
 
     # Method 3: Look for city names followed by descriptions
     if not items:
-        cities = re.findall(
-            r'([A-Z][a-z]+(?:\s+[A-Z][a-z]+){0,2})\s+(?:is|was|has been)\s+(?:ranked|rated|known|named|called|considered|recognized)',
-            text)
+        cities = _RANKED_CITY_RE.findall(text)
         if len(cities) >= 3:
             items = [city.strip() for city in cities]
 
@@ -678,289 +628,112 @@ def extract_list_items(text):
 
 
 def extract_direct_answer(query, text):
-    """Extract the direct answer to a question from text."""
+    """
+    Extract the direct answer to a question from text.
+
+    Every answer pattern contains a literal word (cleanest, capital, the topic, the
+    superlative), so a substring check on the lowercased text rules most texts out
+    before any pattern runs.
+    """
     query = query.lower().strip()
 
     # For "cleanest city" type questions
     if "cleanest city" in query or "cleanest cities" in query:
         # Try different patterns for finding the cleanest city
-        patterns = [
-            r'([A-Z][a-z]+(?:\s+[A-Z][a-z]+)?)\s+(?:is|has been|was|remains)\s+(?:the|recognized as the|consistently|rated as the)\s+cleanest\s+city',
-            r'the\s+cleanest\s+city\s+(?:in|of)\s+[A-Z][a-z]+\s+is\s+([A-Z][a-z]+(?:\s+[A-Z][a-z]+)?)',
-            r'([A-Z][a-z]+(?:\s+[A-Z][a-z]+)?)\s+tops\s+the\s+list\s+of\s+cleanest\s+cities',
-            r'([A-Z][a-z]+(?:\s+[A-Z][a-z]+)?)\s+was\s+awarded\s+the\s+title\s+of\s+cleanest\s+city'
-        ]
-
-        for pattern in patterns:
-            match = re.search(pattern, text, re.IGNORECASE)
-            if match:
-                return match.group(1)
+        if "cleanest" in text.lower():
+            for pattern in _CLEANEST_CITY_PATTERNS:
+                match = pattern.search(text)
+                if match:
+                    return match.group(1)
 
         # If no direct match, try to find the first city in a list context
-        list_pattern = r'(?:1|1st|one|first)[\.\)]\s+([A-Z][a-z]+(?:\s+[A-Z][a-z]+)?)'
-        list_match = re.search(list_pattern, text)
+        list_match = _FIRST_LIST_ITEM_RE.search(text)
         if list_match:
             return list_match.group(1)
 
     # For capital city questions
     elif "capital" in query and ("city" in query or "what is" in query):
-        country_match = re.search(r'capital of ([A-Za-z]+)', query)
-        if country_match:
-            country = country_match.group(1)
-            capital_pattern = rf'(?:capital|capital city) of {country} is ([A-Z][a-z]+(?:\s+[A-Z][a-z]+)?)'
-            capital_match = re.search(capital_pattern, text, re.IGNORECASE)
+        country_match = _COUNTRY_RE.search(query)
+        if country_match and "capital" in text.lower():
+            capital_match = capital_pattern(country_match.group(1)).search(text)
             if capital_match:
                 return capital_match.group(1)
 
     # For "what is" or definition queries
     elif query.startswith("what is"):
         topic = query.replace("what is", "").replace("?", "").strip()
-        if topic:
-            definition_pattern = rf'{topic} (?:is|refers to|means) ([^.!?]+)'
-            definition_match = re.search(definition_pattern, text, re.IGNORECASE)
+        if topic and topic in text.lower():
+            definition_match = definition_pattern(topic).search(text)
             if definition_match:
                 return definition_match.group(1).strip()
 
     # For questions about tallest, shortest, biggest, etc.
-    elif any(word in query for word in ["tallest", "highest", "biggest", "largest", "smallest", "shortest"]):
-        for word in ["tallest", "highest", "biggest", "largest", "smallest", "shortest"]:
-            if word in query:
-                pattern = rf'(?:the|world\'s|earth\'s) {word} ([^.!?]+) is ([A-Z][a-z]+(?:\s+[A-Z][a-z]+)?)'
-                match = re.search(pattern, text, re.IGNORECASE)
+    elif any(word in query for word in _SUPERLATIVES):
+        text_lower = text.lower()
+        for word in _SUPERLATIVES:
+            if word in query and word in text_lower:
+                match = _SUPERLATIVE_PATTERNS[word].search(text)
                 if match:
-                    return f"{match.group(2)} ({match.group(1)})"
+                    return f"{match.group('name')} ({match.group('subject')})"
 
     # No direct answer found
     return None
 
 
-def create_ranking_answer(query, summary):
-    """Create a structured ranking answer for list-type queries."""
-    # Extract list items from the summary
-    items = extract_list_items(summary)
+@lru_cache(maxsize=512)
+def capital_pattern(country):
+    """Compiled pattern for the capital of a country, built once per country."""
+    return re.compile(rf'(?:capital|capital city) of {re.escape(country)} is ({_PROPER_NAME})',
+                      re.IGNORECASE)
+
+
+@lru_cache(maxsize=512)
+def definition_pattern(topic):
+    """Compiled pattern for a definition of a topic, built once per topic (matched literally)."""
+    return re.compile(rf'{re.escape(topic)} (?:is|refers to|means) ([^.!?]+)', re.IGNORECASE)
 
+
+def create_ranking_answer(query, summary, items):
+    """Create a structured ranking answer for list-type queries from the summary's extracted list items."""
     # If we couldn't extract a proper list, return None
     if not items or len(items) < 3:
         return None
 
-    # Format a structured answer
-    result = "<div class='doc-section'>\n"
-
     # Create a header based on the query
-    if "cleanest city" in query.lower() or "cleanest cities" in query.lower():
-        result += "<h3>Top Cleanest Cities</h3>\n"
-    elif "top" in query.lower():
-        result += "<h3>Top Results</h3>\n"
-    elif "best" in query.lower():
-        result += "<h3>Best Results</h3>\n"
+    query_lower = query.lower()
+    if "cleanest city" in query_lower or "cleanest cities" in query_lower:
+        title = "Top Cleanest Cities"
+    elif "top" in query_lower:
+        title = "Top Results"
+    elif "best" in query_lower:
+        title = "Best Results"
     else:
-        result += "<h3>Ranked List</h3>\n"
-
-    # Create a numbered list
-    result += "<ol class='ranked-list'>\n"
-    for item in items[:10]:  # Limit to top 10
-        result += f"<li><strong>{item}</strong></li>\n"
-    result += "</ol>\n</div>\n"
-
-    # Add a brief explanation section
-    result += "<div class='doc-section'>\n"
-    result += "<h3>Context</h3>\n"
-    result += f"<p>{summary[:300]}...</p>\n"
-    result += "</div>\n"
-
-    return result
-
+        title = "Ranked List"
 
-def create_city_ranking_answer(query, summary):
-    """Create a specialized answer for city ranking queries."""
-    # Try to extract the direct answer (top city)
-    top_city = extract_direct_answer(query, summary)
+    # A numbered list (limited to the top 10) followed by a brief context section
+    return _RANKING_TEMPLATE.render(title=title, items=items[:10], context=summary[:300])
 
-    # Try to extract a list of cities
-    city_list = extract_list_items(summary)
 
+def create_city_ranking_answer(query, summary, city_list, top_city, sentences=None):
+    """Create a specialized answer for city ranking queries from the extracted city list and top city."""
     # If we don't have the necessary information, return None
     if not (top_city or (city_list and len(city_list) >= 3)):
         return None
 
-    # Start building the response
-    result = ""
+    # The ranking list (top 10), when there are enough cities to rank
+    cities = city_list[:10] if city_list and len(city_list) >= 3 else None
 
-    # Add the direct answer section if we found one
-    if top_city:
-        result += f"""
-        <div class='doc-section'>
-            <h3>Answer</h3>
-            <p class='direct-answer'><strong>{top_city}</strong> is the cleanest city.</p>
-        </div>
-        """
-
-    # Add the ranking list if available
-    if city_list and len(city_list) >= 3:
-        result += "<div class='doc-section'>\n"
-        result += "<h3>Top 10 Cleanest Cities</h3>\n"
-        result += "<ol class='ranked-list'>\n"
-
-        for i, city in enumerate(city_list[:10]):  # Limit to top 10
-            # Highlight the top city if it matches our direct answer
-            if top_city and city == top_city:
-                result += f"<li><strong>{city}</strong> (Winner)</li>\n"
-            else:
-                result += f"<li><strong>{city}</strong></li>\n"
-
-        result += "</ol>\n</div>\n"
-
-    # If we have a top city, add a details section
-    if top_city:
-        result += "<div class='doc-section'>\n"
-        result += f"<h3>{top_city}'s Cleanliness Initiatives</h3>\n"
-
-        # Extract sentences about the top city
-        city_sentences = []
-        for sentence in re.split(r'(?<=[.!?])\s+', summary):
-            if top_city in sentence and len(sentence) > 30:
-                city_sentences.append(sentence.strip())
-
-        if city_sentences:
-            result += "<ul class='initiative-list'>\n"
-            for sentence in city_sentences[:4]:  # Limit to 4 points
-                result += f"<li>{sentence}</li>\n"
-            result += "</ul>\n"
-        else:
-            # If we can't find specific sentences, add a general paragraph
-            result += f"<p>{summary[:250]}...</p>\n"
-
-        result += "</div>\n"
-
-    # Add a brief explanation of the ranking system if available
-    ranking_info = re.search(r'(?:[Tt]hese rankings|[Tt]he rankings|[Tt]he assessment|[Tt]he survey) [^.!?]+[.!?]',
-                             summary)
-    if ranking_info:
-        result += "<div class='doc-section'>\n"
-        result += "<h3>Ranking Methodology</h3>\n"
-        result += f"<p>{ranking_info.group(0)}</p>\n"
-        result += "</div>\n"
-
-    return result
-
-    # For responses that don't have proper section structure yet, create professional sections
-    if '<div class=\'doc-section\'>' not in response and '<div class="doc-section">' not in response:
-        # Try to split into logical paragraphs and create proper sections
-        sentences = re.split(r'(?<=[.!?])\s+', response)
-
-        if len(sentences) > 5:
-            # Create 2-3 sections depending on content length
-            sections_needed = min(3, max(2, len(sentences) // 8))
-
-            # Try to identify logical section breaks based on content
-            section_titles = []
-
-            # If we have enough sentences, try to extract potential section titles
-            # by looking for sentences that might describe categories or topics
-            potential_sections = []
-            for i, sentence in enumerate(sentences):
-                if i < len(sentences) - 3:  # Don't use sentences near the end
-                    # Look for sentences that might introduce a new topic
-                    if re.search(
-                            r'\b(types|categories|examples|benefits|features|applications|uses|aspects|advantages|steps|stages|phases|components|elements|factors|parts)\b',
-                            sentence.lower()):
-                        potential_sections.append((i, sentence))
-
-            # If we found potential section breaks, use them
-            if len(potential_sections) >= sections_needed - 1:
-                structured_response = ""
-
-                # First section - Introduction
-                start_idx = 0
-
-                for section_idx, (break_idx, break_sentence) in enumerate(potential_sections[:sections_needed - 1]):
-                    # Extract section text
-                    section_text = ' '.join(sentences[start_idx:break_idx])
-
-                    # Generate section title from the breaking sentence
-                    title_match = re.search(
-                        r'\b(types|categories|examples|benefits|features|applications|uses|aspects|advantages|steps|stages|phases|components|elements|factors|parts)\b',
-                        break_sentence.lower())
-                    if title_match:
-                        title_word = title_match.group(0).title()
-                        # Find what the title word applies to
-                        topic_match = re.search(r'of\s+([^.,:;]+)', break_sentence)
-                        if topic_match:
-                            section_title = f"{title_word} of {topic_match.group(1).strip().title()}"
-                        else:
-                            section_title = f"Key {title_word}"
-                    else:
-                        section_title = f"Section {section_idx + 1}"
-
-                    # Add the section
-                    structured_response += f"<div class='doc-section'>\n<h3>{section_title}</h3>\n<p>{section_text}</p>\n</div>\n"
-
-                    # Move to next section
-                    start_idx = break_idx
-
-                # Final section
-                final_section = ' '.join(sentences[start_idx:])
-                structured_response += f"<div class='doc-section'>\n<h3>Summary</h3>\n<p>{final_section}</p>\n</div>\n"
-
-                response = structured_response
-            else:
-                # Fallback: create evenly divided sections
-                sentences_per_section = len(sentences) // sections_needed
-
-                structured_response = ""
-                for i in range(sections_needed):
-                    start_idx = i * sentences_per_section
-                    # For the last section, include all remaining sentences
-                    end_idx = (i + 1) * sentences_per_section if i < sections_needed - 1 else len(sentences)
-                    section_text = ' '.join(sentences[start_idx:end_idx])
-
-                    # Generate generic section titles
-                    if i == 0:
-                        section_title = "Overview"
-                    elif i == sections_needed - 1:
-                        section_title = "Conclusion"
-                    else:
-                        section_title = f"Details {i}"
-
-                    structured_response += f"<div class='doc-section'>\n<h3>{section_title}</h3>\n<p>{section_text}</p>\n</div>\n"
-
-                response = structured_response
-        else:
-            # For shorter responses, ensure there's at least one structured section
-            if not response.startswith('<div class'):
-                response = f"<div class='doc-section'>\n<h3>Quick Information</h3>\n<p>{response}</p>\n</div>"
-
-    # Ensure any paragraphs have proper closing tags
-    if response.count('<p>') > response.count('</p>'):
-        response += '</p>'
-
-    # Add the intro if not already present
-    plain_intros = [intro.replace('<p>', '').replace('<strong>', '').replace('</strong>', '')
-                    for intro in intros[question_type]]
-    if not any(response.startswith(intro.strip()) for intro in plain_intros):
-        # Remove existing paragraph tag if present to avoid nesting issues
-        if response.startswith('<p>'):
-            response = response[3:]
-        response = selected_intro + response
-
-    # Special handling for process/steps type questions - try to create ordered list
-    if question_type == "process" and 'steps' in query_topic:
-        # Look for numbers followed by text, which might be steps
-        step_matches = re.findall(r'(?:^|\s)(\d+)[.)]?\s+([A-Z][^.!?]*[.!?])', response)
-        if step_matches and len(step_matches) >= 3:
-            # Create ordered list
-            steps_html = "<ol>\n"
-            for _, step_text in step_matches:
-                steps_html += f"<li>{step_text.strip()}</li>\n"
-            steps_html += "</ol>\n"
-
-            # Find a good position to add the steps (after intro)
-            intro_end = response.find('</p>')
-            if intro_end > 0:
-                response = response[:intro_end + 4] + "\n" + steps_html + response[intro_end + 4:]
-
-    # Ensure we don't have any unclosed HTML tags
-    if response.count('<p>') > response.count('</p>'):
-        response += '</p>'
-
-    return response
+    # Sentences about the top city (limit to 4 points); the template falls back to a
+    # general paragraph when there are none
+    city_sentences = sentences_mentioning(top_city, summary, sentences, 4) if top_city else None
+
+    # A brief explanation of the ranking system if available
+    ranking_info = _RANKING_INFO_RE.search(summary)
+
+    return _CITY_ANSWER_TEMPLATE.render(
+        top_city=top_city,
+        cities=cities,
+        city_sentences=city_sentences,
+        context=summary[:250],
+        ranking_info=ranking_info.group(0) if ranking_info else None,
+    )
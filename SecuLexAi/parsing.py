@@ -0,0 +1,41 @@
+import re
+from bs4 import BeautifulSoup
+import trafilatura
+
+# HTML-to-text extraction. This module runs inside the search parse-pool workers, so it
+# must stay small and must not import the app (database, Flask, search).
+
+# Where page text is broken into phrases: any line boundary str.splitlines() knows, or a run of 2+ spaces
+_TEXT_BREAK_RE = re.compile(r'[\n\r\x0b\x0c\x1c-\x1e\x85\u2028\u2029]| {2,}')
+
+
+def extract_text(html):
+    """
+    Extract the readable text of a page using trafilatura or BeautifulSoup as fallback.
+
+    Args:
+        html (bytes): The raw page
+
+    Returns:
+        str: The extracted text (may be short or empty if nothing useful was found)
+    """
+    # Try with Trafilatura first (better quality extraction)
+    text = trafilatura.extract(html, include_comments=False, favor_precision=True)
+    if text and len(text) > 200:  # Ensure we got meaningful content
+        return text
+
+    # Fallback to BeautifulSoup if trafilatura didn't work
+    return html_to_text(html)
+
+
+def html_to_text(html):
+    """Strip scripts and page chrome from HTML and return its text, one phrase per line."""
+    soup = BeautifulSoup(html, 'lxml')
+
+    # Remove script and style elements
+    for script in soup(["script", "style", "nav", "footer", "header"]):
+        script.extract()
+
+    # Get text and clean it up, one stripped non-empty phrase per line
+    text = soup.get_text(separator='\n')
+    return '\n'.join(filter(None, map(str.strip, _TEXT_BREAK_RE.split(text))))
@@ -1,13 +1,21 @@
 import os
+import multiprocessing
 import random
+import re
 import time
+import threading
 import urllib.parse
-from concurrent.futures import ThreadPoolExecutor, as_completed
+from collections import OrderedDict
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, ThreadPoolExecutor, as_completed, wait
+from concurrent.futures.process import BrokenProcessPool
 import logging
+import diskcache
 import requests
-from bs4 import BeautifulSoup
-import trafilatura
+from lxml import etree, html as lxml_html
+from requests.adapters import HTTPAdapter
 from requests.exceptions import RequestException
+from urllib3.util.retry import Retry
+from SecuLexAi import parsing
 
 # Configure logging
 logging.basicConfig(level=logging.DEBUG)
@@ -22,6 +30,140 @@ USER_AGENTS = [
     'Mozilla/5.0 (iPhone; CPU iPhone OS 14_6 like Mac OS X) AppleWebKit/605.1.15 (KHTML, like Gecko) Version/14.0 Mobile/15E148 Safari/604.1'
 ]
 
+# Domains and URL fragments to skip, matched case-insensitively anywhere in the URL in one scan
+URL_BLACKLIST = [
+    'youtube.com', 'facebook.com', 'twitter.com', 'instagram.com',
+    'linkedin.com', 'pinterest.com', 'reddit.com', 'tiktok.com',
+    'amazon.com', 'ebay.com', 'netflix.com', 'spotify.com',
+    'apple.com', 'microsoft.com', 'login', 'signin', 'account'
+]
+_BLACKLIST_RE = re.compile('|'.join(map(re.escape, URL_BLACKLIST)), re.IGNORECASE)
+
+# Result links on each engine's page (the CSS selectors a.result__a, a.snippet-title and
+# a.title), compiled once and tried in order
+_RESULT_LINK_XPATHS = tuple(
+    etree.XPath(f"//a[contains(concat(' ', normalize-space(@class), ' '), ' {css_class} ')]")
+    for css_class in (
+        'result__a',  # DuckDuckGo
+        'snippet-title',  # Brave
+        'title',  # Mojeek
+    )
+)
+
+# Pages are streamed and cut off at this size; declared non-HTML responses are skipped unread
+MAX_PAGE_BYTES = 2_000_000
+
+# Page fetches are I/O bound, so one shared pool runs every fetch of a search at once
+# while capping the outbound connections across all concurrent searches
+MAX_CRAWL_WORKERS = 16
+_crawl_executor = ThreadPoolExecutor(max_workers=MAX_CRAWL_WORKERS, thread_name_prefix="crawl-worker")
+
+# Search engines are raced on their own small pool so slow losers never hold crawl workers.
+# Engines are listed in order of preference: a later engine only wins if every earlier one
+# came back empty or is still running ENGINE_GRACE_PERIOD seconds after it answered.
+MAX_ENGINE_WORKERS = 6
+ENGINE_GRACE_PERIOD = 1.0
+_engine_executor = ThreadPoolExecutor(max_workers=MAX_ENGINE_WORKERS, thread_name_prefix="engine-worker")
+
+# Fetches to the same host are spaced HOST_FETCH_INTERVAL seconds apart; fetches to
+# different hosts (the usual case) are not delayed at all
+HOST_FETCH_INTERVAL = 1.0
+_host_next_fetch = {}  # host -> earliest monotonic time of its next fetch
+_host_next_fetch_lock = threading.Lock()
+
+# HTML parsing is CPU bound, so it runs in worker processes instead of contending for the
+# GIL with the crawl threads. Workers are forked from a forkserver that preloads only the
+# small parsing module, never from this multi-threaded process, so the pool can be
+# (re)built safely from any thread. A page that takes longer than PARSE_TIMEOUT seconds
+# (queued or parsing) is skipped so a pathological page can't hold a crawl thread forever.
+PARSE_TIMEOUT = 20
+_parse_pool = None
+_parse_pool_lock = threading.Lock()
+
+# Search result URLs per (query, num_results), kept in-process for a while so a repeated
+# question skips the search engines. Empty results are not cached.
+_search_cache = OrderedDict()
+_search_cache_lock = threading.Lock()
+SEARCH_CACHE_SIZE = 256
+SEARCH_CACHE_TTL = 600
+
+# Extracted page text per URL, kept on disk so it is shared between workers and restarts
+PAGE_CACHE_TTL = 86400
+_page_cache = diskcache.Cache(os.environ.get("SECULEX_CACHE_DIR", os.path.join(".cache", "seculex")))
+
+# Shared HTTP session so repeat requests to a host reuse a kept-alive connection
+# instead of paying a new TCP/TLS handshake every time
+_SESSION = requests.Session()
+_adapter = HTTPAdapter(pool_connections=16, pool_maxsize=32,
+                       max_retries=Retry(total=2, backoff_factor=0.3, status_forcelist=[502, 503, 504]))
+_SESSION.mount('http://', _adapter)
+_SESSION.mount('https://', _adapter)
+
+
+def get_parse_pool():
+    """Return the shared HTML parsing process pool, creating it on first use."""
+    global _parse_pool
+    with _parse_pool_lock:
+        if _parse_pool is None:
+            context = multiprocessing.get_context("forkserver")
+            context.set_forkserver_preload(["SecuLexAi.parsing"])
+            _parse_pool = ProcessPoolExecutor(max_workers=os.cpu_count(), mp_context=context)
+        return _parse_pool
+
+
+def parse_page(html):
+    """
+    Extract a page's text in the parse pool.
+
+    Falls back to parsing in this thread if the pool is broken, and gives up on the page
+    (returning "") if it isn't parsed within PARSE_TIMEOUT seconds.
+    """
+    pool = get_parse_pool()
+    future = pool.submit(parsing.extract_text, html)
+    try:
+        return future.result(timeout=PARSE_TIMEOUT)
+    except BrokenProcessPool:
+        # A worker died (OOM kill, parser crash); the executor never recovers from that,
+        # so drop it for the next page to start a fresh one
+        logger.warning("HTML parse pool is broken; restarting it and parsing this page in-thread")
+        retire_parse_pool(pool)
+        return parsing.extract_text(html)
+    except TimeoutError:
+        if future.cancel():
+            # Still queued behind other pages: the pool is busy, not stuck
+            logger.warning(f"HTML parse pool busy for {PARSE_TIMEOUT}s; skipping page")
+        else:
+            # A worker is stuck on this page and would never take another one; replace the pool
+            logger.warning(f"Parsing a page took over {PARSE_TIMEOUT}s; skipping it and restarting the pool")
+            retire_parse_pool(pool, terminate=True)
+        return ""
+
+
+def retire_parse_pool(pool, terminate=False):
+    """Stop handing out the given parse pool and shut it down, killing its workers if asked."""
+    global _parse_pool
+    with _parse_pool_lock:
+        if _parse_pool is pool:
+            _parse_pool = None
+
+    # Pages still parsing in killed workers fail with BrokenProcessPool and fall back in-thread
+    if terminate:
+        for process in list((pool._processes or {}).values()):
+            process.terminate()
+    pool.shutdown(wait=False, cancel_futures=True)
+
+
+def wait_for_host(url):
+    """Sleep only as long as needed to keep fetches to the URL's host HOST_FETCH_INTERVAL apart."""
+    host = urllib.parse.urlparse(url).netloc
+    with _host_next_fetch_lock:
+        now = time.monotonic()
+        fetch_at = max(now, _host_next_fetch.get(host, now))
+        _host_next_fetch[host] = fetch_at + HOST_FETCH_INTERVAL
+
+    if fetch_at > now:
+        time.sleep(fetch_at - now)
+
 
 def get_random_user_agent():
     """Return a random user agent from the list."""
@@ -56,16 +198,20 @@ def search_web(query, num_results=8):
         3. Trying again later
         """
 
+        # Pick one user agent for the whole search, so hosts see a consistent client
+        # on the kept-alive connections
+        user_agent = get_random_user_agent()
+
         try:
             # Try to get search results with timeout
-            search_urls = get_search_results(query, num_results)
+            search_urls = get_search_results(query, num_results, user_agent)
             logger.debug(f"Found {len(search_urls)} search results")
 
             if not search_urls:
                 return "No search results found for the query. Please try a different search term or check your internet connection."
 
             # Crawl websites in parallel
-            all_text = crawl_websites(search_urls)
+            all_text = crawl_websites(search_urls, user_agent)
 
             if not all_text or len(all_text) < 100:
                 logger.warning("No significant text extracted from search results")
@@ -82,156 +228,203 @@ def search_web(query, num_results=8):
         return f"Error searching the web: {str(e)}"
 
 
-def get_search_results(query, num_results=8):
+def get_search_results(query, num_results=8, user_agent=None):
     """
     Get search result URLs for the given query.
     
     This function implements a basic web search without using any rate-limited API.
-    It sends a request to DuckDuckGo and parses the HTML response.
+    It sends a request to DuckDuckGo and parses the HTML response. Results are cached
+    in-process for SEARCH_CACHE_TTL seconds.
     """
+    cache_key = (query, num_results)
+    with _search_cache_lock:
+        entry = _search_cache.get(cache_key)
+        if entry is not None:
+            expires_at, urls = entry
+            if expires_at >= time.monotonic():
+                _search_cache.move_to_end(cache_key)
+                logger.debug(f"Using cached search results for query: {query}")
+                return list(urls)
+            del _search_cache[cache_key]
+
+    urls = fetch_search_results(query, num_results, user_agent)
+
+    if urls:
+        with _search_cache_lock:
+            _search_cache[cache_key] = (time.monotonic() + SEARCH_CACHE_TTL, tuple(urls))
+            _search_cache.move_to_end(cache_key)
+            while len(_search_cache) > SEARCH_CACHE_SIZE:
+                _search_cache.popitem(last=False)
+
+    return urls
+
+
+def fetch_search_results(query, num_results=8, user_agent=None):
+    """Query the search engines for result URLs (uncached)."""
     try:
+        user_agent = user_agent or get_random_user_agent()
+
         # Format the query for the URL
         encoded_query = urllib.parse.quote(query)
 
-        # URLs to try (fallbacks in case one gets blocked)
+        # Search engines to query (several, in case one gets blocked), most preferred first
         search_engines = [
             f"https://html.duckduckgo.com/html/?q={encoded_query}",
             f"https://search.brave.com/search?q={encoded_query}",
             f"https://www.mojeek.com/search?q={encoded_query}"
         ]
 
-        all_urls = []
-
-        # Try each search engine until we get results
-        for search_url in search_engines:
-            try:
-                headers = {
-                    'User-Agent': get_random_user_agent(),
-                    'Accept': 'text/html,application/xhtml+xml,application/xml',
-                    'Accept-Language': 'en-US,en;q=0.9',
-                    'Referer': 'https://www.google.com/'
-                }
-
-                response = requests.get(search_url, headers=headers, timeout=10)
-
-                if response.status_code == 200:
-                    soup = BeautifulSoup(response.text, 'html.parser')
-
-                    # Different selectors for different search engines
-                    selectors = [
-                        # DuckDuckGo
-                        ('a.result__a', 'href'),
-                        # Brave
-                        ('a.snippet-title', 'href'),
-                        # Mojeek
-                        ('a.title', 'href')
-                    ]
-
-                    for selector, attr in selectors:
-                        links = soup.select(selector)
-                        if links:
-                            for link in links:
-                                url = link.get(attr)
-
-                                # Process URLs based on search engine
-                                if isinstance(search_url, str) and search_url.startswith('https://html.duckduckgo.com'):
-                                    # DuckDuckGo uses redirects
-                                    if isinstance(url, str) and url.startswith('/'):
-                                        continue
-
-                                    # Extract actual URL from DuckDuckGo redirect
-                                    if isinstance(url, str) and 'uddg=' in url:
-                                        url = urllib.parse.unquote(url.split('uddg=')[1].split('&')[0])
-
-                                # Skip unwanted URLs
-                                if is_valid_url(url):
-                                    all_urls.append(url)
-
-                            # If we found links, break the selector loop
-                            break
-
-                    # If we found links, break the search engine loop
-                    if all_urls:
+        # Query all search engines at once; once a winner is picked the others give up
+        stop = threading.Event()
+        future_to_engine = {_engine_executor.submit(search_engine_links, url, user_agent, stop): url
+                            for url in search_engines}
+        futures = list(future_to_engine)
+        results = {}
+        pending = set(futures)
+        deadline = None
+        try:
+            while pending:
+                timeout = None if deadline is None else max(0.0, deadline - time.monotonic())
+                done, pending = wait(pending, timeout=timeout, return_when=FIRST_COMPLETED)
+                if not done:
+                    break  # grace period over, settle for the best engine that answered
+
+                for future in done:
+                    try:
+                        results[future] = future.result()
+                    except Exception as e:
+                        logger.warning(f"Error with search engine {future_to_engine[future]}: {str(e)}")
+                        results[future] = []
+
+                # The most preferred engine with results wins once every engine ahead of it is done
+                best = next((i for i, future in enumerate(futures) if results.get(future)), None)
+                if best is not None:
+                    if all(future in results for future in futures[:best]):
                         break
+                    if deadline is None:
+                        deadline = time.monotonic() + ENGINE_GRACE_PERIOD
+        finally:
+            stop.set()
+            for future in pending:
+                future.cancel()
 
-            except Exception as e:
-                logger.warning(f"Error with search engine {search_url}: {str(e)}")
-                continue
-
-        # Take only unique URLs up to num_results
-        unique_urls = []
-        for url in all_urls:
-            if url not in unique_urls:
-                unique_urls.append(url)
-                if len(unique_urls) >= num_results:
-                    break
+        all_urls = next((results[future] for future in futures if results.get(future)), [])
 
-        return unique_urls
+        # Take only unique URLs (in result order) up to num_results
+        return list(dict.fromkeys(all_urls))[:num_results]
 
     except Exception as e:
         logger.error(f"Error in get_search_results: {str(e)}", exc_info=True)
         return []
 
 
+def search_engine_links(search_url, user_agent, stop=None):
+    """
+    Fetch one search engine's result page and return the valid result URLs on it.
+
+    If the stop event is set (another engine already won) before the request is sent or
+    by the time the response arrives, the engine gives up and returns no URLs.
+    """
+    if stop is not None and stop.is_set():
+        return []
+
+    headers = {
+        'User-Agent': user_agent,
+        'Accept': 'text/html,application/xhtml+xml,application/xml',
+        'Accept-Language': 'en-US,en;q=0.9',
+        'Referer': 'https://www.google.com/'
+    }
+
+    response = _SESSION.get(search_url, headers=headers, timeout=10)
+    if stop is not None and stop.is_set():
+        return []
+
+    urls = []
+    if response.status_code == 200:
+        tree = lxml_html.fromstring(response.content)
+
+        # Different selectors for different search engines
+        for link_xpath in _RESULT_LINK_XPATHS:
+            links = link_xpath(tree)
+            if links:
+                for link in links:
+                    url = link.get('href')
+
+                    # Process URLs based on search engine
+                    if search_url.startswith('https://html.duckduckgo.com'):
+                        # DuckDuckGo uses redirects
+                        if isinstance(url, str) and url.startswith('/'):
+                            continue
+
+                        # Extract actual URL from DuckDuckGo redirect
+                        if isinstance(url, str) and 'uddg=' in url:
+                            url = urllib.parse.unquote(url.split('uddg=')[1].split('&')[0])
+
+                    # Skip unwanted URLs
+                    if is_valid_url(url):
+                        urls.append(url)
+
+                # If we found links, break the selector loop
+                break
+
+    return urls
+
+
 def is_valid_url(url):
     """Check if a URL is valid and not a blacklisted domain."""
     if not url or not isinstance(url, str):
         return False
 
-    # Skip URLs that don't start with http
-    if not url.startswith(('http://', 'https://')):
-        return False
+    # Skip URLs that don't start with http, or that contain any blacklisted domain
+    return url.startswith(('http://', 'https://')) and not _BLACKLIST_RE.search(url)
 
-    # Blacklist of domains to skip
-    blacklist = [
-        'youtube.com', 'facebook.com', 'twitter.com', 'instagram.com',
-        'linkedin.com', 'pinterest.com', 'reddit.com', 'tiktok.com',
-        'amazon.com', 'ebay.com', 'netflix.com', 'spotify.com',
-        'apple.com', 'microsoft.com', 'login', 'signin', 'account'
-    ]
 
-    # Check if URL contains any blacklisted domain
-    for domain in blacklist:
-        if domain in url.lower():
-            return False
+def extract_text_from_url(url, user_agent=None):
+    """
+    Extract clean text from a URL, reusing text cached on disk within PAGE_CACHE_TTL.
+    """
+    try:
+        cached = _page_cache.get(url)
+    except Exception as e:
+        logger.warning(f"Error reading page cache for {url}: {str(e)}")
+        cached = None
+    if cached is not None:
+        logger.debug(f"Using cached text for {url}")
+        return cached
 
-    return True
+    text = download_and_extract_text(url, user_agent)
 
+    # Only successful extractions are cached so failures are retried next time
+    if text:
+        try:
+            _page_cache.set(url, text, expire=PAGE_CACHE_TTL)
+        except Exception as e:
+            logger.warning(f"Error writing page cache for {url}: {str(e)}")
 
-def extract_text_from_url(url):
+    return text
+
+
+def download_and_extract_text(url, user_agent=None):
     """
     Extract clean text from a URL using trafilatura or BeautifulSoup as fallback.
     """
     try:
-        headers = {'User-Agent': get_random_user_agent()}
-
-        # Add a random delay to avoid looking like a bot
-        time.sleep(random.uniform(0.5, 2.0))
+        headers = {
+            'User-Agent': user_agent or get_random_user_agent(),
+            'Accept': 'text/html,application/xhtml+xml'
+        }
 
-        # Try with Trafilatura first (better quality extraction)
-        downloaded = trafilatura.fetch_url(url)
-        if downloaded:
-            text = trafilatura.extract(downloaded)
-            if text and len(text) > 200:  # Ensure we got meaningful content
-                return f"From {url}:\n\n{text}\n\n"
+        # Don't hit the same host in quick succession
+        wait_for_host(url)
 
-        # Fallback to BeautifulSoup if trafilatura didn't work
-        response = requests.get(url, headers=headers, timeout=10)
-        if response.status_code == 200:
-            soup = BeautifulSoup(response.text, 'html.parser')
+        # Download the page once through the shared session; both extractors parse the same bytes
+        html = fetch_html(url, headers)
+        if not html:
+            return ""
 
-            # Remove script and style elements
-            for script in soup(["script", "style", "nav", "footer", "header"]):
-                script.extract()
-
-            # Get text and clean it up
-            text = soup.get_text(separator='\n')
-            lines = (line.strip() for line in text.splitlines())
-            chunks = (phrase.strip() for line in lines for phrase in line.split("  "))
-            text = '\n'.join(chunk for chunk in chunks if chunk)
-
-            if text and len(text) > 200:  # Ensure we got meaningful content
-                return f"From {url}:\n\n{text}\n\n"
+        text = parse_page(html)
+        if text and len(text) > 200:  # Ensure we got meaningful content
+            return f"From {url}:\n\n{text}\n\n"
 
         return ""
 
@@ -240,33 +433,59 @@ def extract_text_from_url(url):
         return ""
 
 
-def crawl_websites(urls):
+def fetch_html(url, headers):
+    """
+    Download a page through the shared session.
+
+    The body is streamed and cut off at MAX_PAGE_BYTES, and responses that declare a
+    non-HTML content type (PDFs, videos, ...) are dropped before their body is read.
+
+    Returns:
+        bytes: The raw page, or None if the request failed or the page is not HTML
+    """
+    with _SESSION.get(url, headers=headers, timeout=10, stream=True) as response:
+        content_type = response.headers.get('Content-Type', '')
+        if response.status_code != 200 or (content_type and 'html' not in content_type):
+            return None
+
+        chunks = []
+        size = 0
+        for chunk in response.iter_content(chunk_size=65536):
+            chunks.append(chunk)
+            size += len(chunk)
+            if size >= MAX_PAGE_BYTES:
+                break
+        return b''.join(chunks)
+
+
+def crawl_websites(urls, user_agent=None):
     """
     Crawl multiple websites in parallel and combine their text.
     
     Args:
         urls (list): List of URLs to crawl
+        user_agent (str): User agent sent to every website (random if not given)
         
     Returns:
         str: Combined text from all websites
     """
     all_text = []
 
-    # Use ThreadPoolExecutor for parallel crawling
-    with ThreadPoolExecutor(max_workers=4) as executor:
-        future_to_url = {executor.submit(extract_text_from_url, url): url for url in urls}
-
-        for future in as_completed(future_to_url):
-            url = future_to_url[future]
-            try:
-                text = future.result()
-                if text:
-                    all_text.append(text)
-                    logger.debug(f"Successfully extracted text from {url} ({len(text)} chars)")
-                else:
-                    logger.debug(f"No usable text extracted from {url}")
-            except Exception as e:
-                logger.warning(f"Error processing {url}: {str(e)}")
+    # Crawl all URLs in parallel on the shared crawl pool
+    user_agent = user_agent or get_random_user_agent()
+    future_to_url = {_crawl_executor.submit(extract_text_from_url, url, user_agent): url for url in urls}
+
+    for future in as_completed(future_to_url):
+        url = future_to_url[future]
+        try:
+            text = future.result()
+            if text:
+                all_text.append(text)
+                logger.debug(f"Successfully extracted text from {url} ({len(text)} chars)")
+            else:
+                logger.debug(f"No usable text extracted from {url}")
+        except Exception as e:
+            logger.warning(f"Error processing {url}: {str(e)}")
 
     if not all_text:
         return "Could not extract useful information from the search results."
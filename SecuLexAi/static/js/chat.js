@@ -229,6 +229,43 @@ document.addEventListener('DOMContentLoaded', function() {
         }
     }
     
+    // Turn an HTTP error status into a descriptive error, otherwise parse the JSON body
+    function parseResponse(response) {
+        if (!response.ok) {
+            if (response.status === 500) {
+                throw new Error('Server error. The system might be experiencing issues.');
+            } else if (response.status === 404) {
+                throw new Error('API endpoint not found.');
+            } else if (response.status === 0) {
+                throw new Error('Network connection lost. Please check your internet connection.');
+            } else {
+                throw new Error(`Server responded with status code: ${response.status}`);
+            }
+        }
+        return response.json();
+    }
+    
+    // Poll for the answer to a query that is being searched on the web, giving up
+    // after maxAttempts polls one second apart
+    function pollForResult(taskId, maxAttempts = 120) {
+        if (maxAttempts <= 0) {
+            return Promise.reject(new Error('The web search is taking too long. Please try again.'));
+        }
+        return new Promise(resolve => setTimeout(resolve, 1000))
+            .then(() => fetch(`/ask_result/${taskId}`))
+            .then(response => {
+                // 202 means the web search is still running
+                if (response.status === 202) {
+                    return pollForResult(taskId, maxAttempts - 1);
+                }
+                // 404 means the server no longer knows the task (expired or restarted)
+                if (response.status === 404) {
+                    throw new Error('This answer has expired. Please ask again.');
+                }
+                return parseResponse(response);
+            });
+    }
+    
     // Handle form submission
     messageForm.addEventListener('submit', function(e) {
         e.preventDefault();
@@ -264,23 +301,17 @@ document.addEventListener('DOMContentLoaded', function() {
             // Add a longer timeout for the fetch request
             timeout: 30000
         })
-        .then(response => {
-            clearTimeout(timeoutId);
-            
-            if (!response.ok) {
-                if (response.status === 500) {
-                    throw new Error('Server error. The system might be experiencing issues.');
-                } else if (response.status === 404) {
-                    throw new Error('API endpoint not found.');
-                } else if (response.status === 0) {
-                    throw new Error('Network connection lost. Please check your internet connection.');
-                } else {
-                    throw new Error(`Server responded with status code: ${response.status}`);
-                }
+        .then(parseResponse)
+        .then(data => {
+            // Answers that aren't in the knowledge base are searched in the background
+            if (data.task_id) {
+                return pollForResult(data.task_id);
             }
-            return response.json();
+            return data;
         })
         .then(data => {
+            clearTimeout(timeoutId);
+            
             // Remove loading indicator
             removeLoadingIndicator(loadingIndicator);
             
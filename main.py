@@ -1,6 +1,16 @@
-from SecuLexAi.main import app
+from SecuLexAi.main import create_app
+
+# This file serves as an entry point for Gunicorn to load the Flask application ("main:app").
+# The app is created on first access rather than at import, so processes that only import
+# this module (parse-pool workers re-import the launching script) never initialize it.
+
+
+def __getattr__(name):
+    if name == 'app':
+        app = globals()['app'] = create_app()
+        return app
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
 
-# This file serves as an entry point for Gunicorn to load the Flask application
 
 if __name__ == '__main__':
-    app.run(host='127.0.0.1', port=8000, debug=True)
\ No newline at end of file
+    create_app().run(host='127.0.0.1', port=8000, debug=True)